@@ -5,12 +5,87 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+The Socket.IO server (`argus_server.asyncsocket`) is mounted next to Django,
+so the whole server runs on one event loop:
+
+    uvicorn argus_server.asgi:application --port 8000
+
+Django runs each sync view in its own thread; at most ``asgi_threads`` views
+run at the same time (`ConcurrencyLimit`), the other requests wait on the event
+loop, so a burst of slow requests can not spawn unbounded threads nor delay the
+socket clients. The downloads are then sent block by block (see
+`base.downloads`).
 """
 
+import asyncio
 import os
 
+import socketio
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'argus_server.settings')
 
-application = get_asgi_application()
+django_app = get_asgi_application()
+
+# Need the settings, imported once Django is set up
+from base.astropool import astronomy_pool  # noqa: E402
+from .asyncsocket import sio, start_push  # noqa: E402
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class ConcurrencyLimit:
+    """
+    ASGI middleware running at most ``limit`` HTTP requests of ``app`` at the same time.
+
+    A request leaves the limit when its response starts, the view is done by
+    then. The body of the response is not sent any further once the client
+    disconnected.
+    """
+
+    def __init__(self, app, limit):
+        self.app = app
+        self.limit = limit
+        self._semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self._semaphore is None:
+            # Created in the running loop
+            self._semaphore = asyncio.Semaphore(self.limit)
+
+        await self._semaphore.acquire()
+        held = True
+        disconnected = None
+
+        async def send_while_connected(message):
+            nonlocal held, disconnected
+            if message['type'] == 'http.response.start':
+                self._semaphore.release()
+                held = False
+                # Django read the whole request already, the next message is the disconnection
+                disconnected = asyncio.ensure_future(receive())
+            elif disconnected is not None and disconnected.done():
+                raise ClientDisconnected()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_while_connected)
+        except ClientDisconnected:
+            pass
+        finally:
+            if held:
+                self._semaphore.release()
+            if disconnected is not None:
+                disconnected.cancel()
+
+
+# Warm up the astronomy workers while the server starts
+astronomy_pool.start()
+
+application = socketio.ASGIApp(sio, ConcurrencyLimit(django_app, settings.ASGI_THREADS), on_startup=start_push)
@@ -0,0 +1,131 @@
+"""
+Socket.IO server of the ASGI deployment (see `argus_server.asgi`).
+
+Same events as the eventlet server of `argus_server.socket`, on a
+`socketio.AsyncServer`. The handlers run on the event loop, so everything that
+blocks (the ORM, the astronomy of the coordinate checks) goes through
+`run_blocking`, a thread pool of ``asgi_threads`` threads.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+import socketio
+from django.conf import settings
+
+from base.coordcheck import COORD_CHECKS
+from base.sessioncache import session_cache
+from base.notifier import pop_progress, pop_telescope_diff, progress_snapshot, telescope_snapshot
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
+
+TELESCOPE_ROOM = 'telescope'
+STATUS_PUSH_INTERVAL = 0.5  # Seconds between checks for telescope changes to push
+COORD_CHECK_DEBOUNCE = settings.COORD_CHECK_DEBOUNCE
+
+_executor = ThreadPoolExecutor(max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi-blocking')
+
+
+async def run_blocking(function, *args, **kwargs):
+    """Run a blocking ``function`` in the thread pool and wait for its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(function, *args, **kwargs))
+
+
+@sio.event
+async def connect(sid, environ):
+    # Authenticate from the session cookie, cached (see base.sessioncache)
+    cookie = environ.get('HTTP_COOKIE')
+    if not cookie:
+        print(f"Cookie not found in request for SID: {sid}")
+        return False
+
+    user = await run_blocking(session_cache.authenticate_cookie, cookie)
+    if user is None:
+        print(f"User with SID {sid} not authenticated.")
+        return False
+
+    user_id, username = user
+    # Later events read the user from the socket session
+    await sio.save_session(sid, {'user_id': user_id, 'username': username})
+    print(f"Authenticated user {username} connected with SID: {sid}")
+    sio.enter_room(sid, TELESCOPE_ROOM)
+    await sio.emit('telescope_status', telescope_snapshot(), room=sid)
+    await sio.emit('plan_progress', progress_snapshot(), room=sid)
+    return True
+
+
+@sio.event
+async def message(sid, data):
+    print('message:', data)
+
+
+# Latest check asked by each (sid, event) and not answered yet, and the
+# (sid, event) with a task answering them. Only touched from the event loop.
+_pending_checks = {}
+_check_tasks = set()
+
+
+def _queue_check(sid, event, data):
+    """Coalesce the checks of a client, as `argus_server.socket._queue_check`."""
+    key = (sid, event)
+    _pending_checks[key] = data
+    if key not in _check_tasks:
+        _check_tasks.add(key)
+        sio.start_background_task(_answer_checks, key)
+
+
+async def _answer_checks(key):
+    sid, event = key
+    check, answer = COORD_CHECKS[event]
+    while True:
+        await sio.sleep(COORD_CHECK_DEBOUNCE)
+        data = _pending_checks.pop(key, None)
+        if data is None:
+            _check_tasks.discard(key)
+            return
+        await sio.emit(answer, await run_blocking(check, data), room=sid)
+
+
+@sio.event
+async def checkcoord(sid, data):
+    _queue_check(sid, 'checkcoord', data)
+
+
+@sio.event
+async def checkcoordondate(sid, data):
+    _queue_check(sid, 'checkcoordondate', data)
+
+
+@sio.event
+async def check_telescope_status(sid, data=None):
+    # Kept for clients that still ask, the state comes from memory
+    await sio.emit('telescope_status', telescope_snapshot(), room=sid)
+
+
+async def push_telescope_status():
+    """Push the telescope diffs and the plan progress, as `argus_server.socket.push_telescope_status`."""
+    while True:
+        await sio.sleep(STATUS_PUSH_INTERVAL)
+        try:
+            diff = pop_telescope_diff()
+            if diff:
+                await sio.emit('telescope_status_diff', diff, room=TELESCOPE_ROOM)
+            changed, progress = pop_progress()
+            if changed:
+                await sio.emit('plan_progress', progress, room=TELESCOPE_ROOM)
+        except Exception as e:
+            print(f"Could not push the telescope status: {e}")
+
+
+@sio.event
+async def disconnect(sid):
+    for event in COORD_CHECKS:
+        _pending_checks.pop((sid, event), None)
+    print('Disconnected:', sid)
+
+
+def start_push():
+    """Start the status push, once the event loop runs (ASGI lifespan startup)."""
+    sio.start_background_task(push_telescope_status)
@@ -187,14 +187,77 @@ DB_NAME = config['telescope']['db_name']
 
 ORCHESTRATE_FOLDER = str(config['telescope']['orchestrate_folder'])
 IMAGES_FOLDER = config['telescope']['images_folder']
+# Prefix of the frame names, to tell the frames of the running document (base.progress);
+# empty: learned from the result documents
+IMAGES_PREFIX = config['telescope'].get('images_prefix', '').strip()
+# Temporary documents and journal of the hand-offs to orchestrate (base.handoff). Next to the
+# orchestrate folder, not inside it, and on the same volume so the renames are atomic
+HANDOFF_FOLDER = config['telescope'].get(
+    'handoff_folder', os.path.join(os.path.dirname(os.path.normpath(ORCHESTRATE_FOLDER)), 'argus_handoff'))
+
+# Local JPL ephemeris (BSP) used for planet positions, loaded on first use
+EPHEMERIS_FILE = config['telescope'].get('ephemeris_file', 'de421.bsp')
+# Minutes between samples of the precomputed planet positions table
+EPHEMERIS_TABLE_STEP = float(config['telescope'].get('ephemeris_table_step_minutes', '10'))
+
+# auto, events or polling
+ORCHESTRATE_WATCHER = config['telescope'].get('orchestrate_watcher', 'auto')
 
 TEMPO_FILTRO = float(config['telescope']['tempo_espera_apos_filtro'])
 TEMPO_FRAME = float(config['telescope']['tempo_espera_entre_frames'])
 TEMPO_DESLIZE = float(config['telescope']['tempo_espera_apos_deslizar'])
 
+# Only used for documents whose duration can not be predicted
 OPERATION_TIMEOUT = float(config['telescope']['tempo_maximo_operacao_telescopio'])
+# A running document is stalled when orchestrate is silent for longer than the
+# predicted duration times STALL_FACTOR, plus STALL_GRACE seconds (see base.progress)
+STALL_FACTOR = float(config['telescope'].get('fator_tempo_operacao', '1.5'))
+STALL_GRACE = float(config['telescope'].get('margem_tempo_operacao', '30'))
+
+# Slew speed of the mount in degrees per second, used to estimate slew times
+SLEW_RATE = float(config['telescope'].get('velocidade_deslize', '3'))
+
+# Cost model of the orchestrate documents (seconds), measured from the orchestrate logs
+TEMPO_TROCA_FILTRO = float(config['telescope'].get('tempo_troca_filtro', '5'))
+TEMPO_LEITURA_IMAGEM = float(config['telescope'].get('tempo_leitura_imagem', '15'))
+# Slews longer than this (degrees) wait the full tempo_espera_apos_deslizar
+DISTANCIA_DESLIZE_COMPLETO = float(config['telescope'].get('distancia_deslize_completo', '10'))
+
+# Automatic queue scheduler
+SCHEDULER_ENABLED = config['telescope'].getboolean('scheduler_enabled', fallback=False)
+SCHEDULER_INTERVAL = float(config['telescope'].get('scheduler_interval_seconds', '10'))
+SCHEDULER_GRACE = float(config['telescope'].get('scheduler_grace_minutes', '60'))
+SCHEDULER_MERGE_RADIUS = float(config['telescope'].get('scheduler_merge_radius', '0'))
+SCHEDULER_MERGE_MAX = int(config['telescope'].get('scheduler_merge_max', '4'))
 
 TEMPO_EXPOSICAO_MAXIMO = float(config['telescope']['tempo_exposicao_maximo'])
 
+# Minutes between samples of the nightly observability planner
+PLANNER_STEP = float(config['telescope'].get('planner_step_minutes', '2'))
+
+CATALOG_CACHE_BUCKET = float(config['telescope'].get('catalog_cache_bucket_seconds', '60'))
+CATALOG_CACHE_SIZE = int(config['telescope'].get('catalog_cache_size', '32'))
+
+# Authenticated sessions of the Socket.IO connections (see base.sessioncache)
+SOCKET_SESSION_CACHE_TTL = float(config['telescope'].get('socket_session_cache_seconds', '60'))
+SOCKET_SESSION_CACHE_SIZE = int(config['telescope'].get('socket_session_cache_size', '1024'))
+
+# Coordinate checks of the observation page (see base.coordcheck)
+COORD_CHECK_DEBOUNCE = float(config['telescope'].get('coord_check_debounce_seconds', '0.2'))
+COORD_CHECK_BUCKET = float(config['telescope'].get('coord_check_bucket_seconds', '10'))
+COORD_CHECK_DECIMALS = int(config['telescope'].get('coord_check_decimals', '3'))
+COORD_CHECK_CACHE_SIZE = int(config['telescope'].get('coord_check_cache_size', '4096'))
+
+# Threads for the blocking work (ORM, astronomy, files) of the ASGI server (see argus_server.asgi)
+ASGI_THREADS = int(config['telescope'].get('asgi_threads', '8'))
+
+# Worker processes for the astronomy of the requests (see base.astropool)
+ASTRONOMY_WORKERS = int(config['telescope'].get('astronomy_workers', '2'))
+ASTRONOMY_TIMEOUT = float(config['telescope'].get('astronomy_timeout_seconds', '10'))
+
+# Disk cache of the FITS preview thumbnails
+PREVIEW_CACHE_FOLDER = config['telescope'].get('preview_cache_folder', str(BASE_DIR / 'previews'))
+PREVIEW_CACHE_SIZE = float(config['telescope'].get('preview_cache_size_mb', '200'))
+
 assert os.path.exists(ORCHESTRATE_FOLDER), f"Orchestrate folder ({ORCHESTRATE_FOLDER}) does not exist"
 assert os.path.exists(IMAGES_FOLDER), f"Images folder ({IMAGES_FOLDER}) does not exist"
\ No newline at end of file
@@ -1,85 +1,116 @@
 import socketio
-from django.contrib.sessions.models import Session
-from django.contrib.auth import get_user_model
-from datetime import datetime
 import json
+import threading
 
 from django.conf import settings
-from base.models import Telescope
-from base.auxiliares import brasilia_to_utc, check_coordinate_for_obs_angle
+from base.coordcheck import COORD_CHECKS
+from base.sessioncache import session_cache
+from base.notifier import pop_progress, pop_telescope_diff, progress_snapshot, telescope_snapshot
 
 sio = socketio.Server(cors_allowed_origins="*")
 
+TELESCOPE_ROOM = 'telescope'
+STATUS_PUSH_INTERVAL = 0.5  # Seconds between checks for telescope changes to push
+COORD_CHECK_DEBOUNCE = settings.COORD_CHECK_DEBOUNCE
+
 @sio.event
 def connect(sid, environ):
-    # Extract sessionid from the cookies
+    # Authenticate from the session cookie, cached (see base.sessioncache)
     cookie = environ.get('HTTP_COOKIE')
     if not cookie:
-        print(f"Cookie not found in request: {environ}")
-        return False
-
-    # Parse the cookie to get sessionid
-    cookie_dict = {i.split('=')[0].strip(): i.split('=')[1].strip() for i in cookie.split(';')}
-    session_key = cookie_dict.get('sessionid', None)
-
-    if not session_key:
-        print(f"Session key not found in cookie: {cookie}")
+        print(f"Cookie not found in request for SID: {sid}")
         return False
 
-    # Get session and check if user is authenticated
-    try:
-        session = Session.objects.get(session_key=session_key)
-        user_id = session.get_decoded().get('_auth_user_id')
-        User = get_user_model()
-        user = User.objects.get(id=user_id)
-
-        if user.is_authenticated:
-            print(f"Authenticated user {user.username} connected with SID: {sid}")
-            return True
-        else:
-            print(f"User with SID {sid} not authenticated.")
-            return False
-    except (Session.DoesNotExist, User.DoesNotExist):
+    user = session_cache.authenticate_cookie(cookie)
+    if user is None:
         print(f"User with SID {sid} not authenticated.")
         return False
 
+    user_id, username = user
+    # Later events read the user from the socket session
+    sio.save_session(sid, {'user_id': user_id, 'username': username})
+    print(f"Authenticated user {username} connected with SID: {sid}")
+    sio.enter_room(sid, TELESCOPE_ROOM)
+    sio.emit('telescope_status', telescope_snapshot(), room=sid)
+    sio.emit('plan_progress', progress_snapshot(), room=sid)
+    return True
+
 @sio.event
 def message(sid, data):
     print('message:', data)
 
+# Latest check asked by each (sid, event) and not answered yet, and the
+# (sid, event) with a task answering them
+_pending_checks = {}
+_check_tasks = set()
+_checks_lock = threading.Lock()
+
+def _queue_check(sid, event, data):
+    """
+    Coalesce the checks of a client: the page asks on every keystroke, so a
+    check waits ``coord_check_debounce_seconds`` and is replaced by any newer
+    check of the same event. Each client has at most one check of each event
+    running, and only the last coordinate typed is answered.
+    """
+    key = (sid, event)
+    with _checks_lock:
+        _pending_checks[key] = data
+        if key in _check_tasks:
+            return
+        _check_tasks.add(key)
+    sio.start_background_task(_answer_checks, key)
+
+def _answer_checks(key):
+    sid, event = key
+    check, answer = COORD_CHECKS[event]
+    while True:
+        sio.sleep(COORD_CHECK_DEBOUNCE)
+        with _checks_lock:
+            data = _pending_checks.pop(key, None)
+            if data is None:
+                _check_tasks.discard(key)
+                return
+        sio.emit(answer, check(data), room=sid)
+
 @sio.event
 def checkcoord(sid, data):
-    try:
-        ra = data['ra']
-        dec = data['dec']
-        status = check_coordinate_for_obs_angle(ra, dec)
-        allowed = status[0]
-        distance = status[1]
-        sio.emit('coordchecked', {'allowed': allowed, 'distance': distance}, room=sid)
-    except:
-        sio.emit('coordcheckedondate', {'allowed': False, 'distance': 0}, room=sid)
+    _queue_check(sid, 'checkcoord', data)
 
 @sio.event
 def checkcoordondate(sid, data):
-    try:
-        ra = data['ra']
-        dec = data['dec']
-        date = data['date']
-        date_obj = datetime.strptime(date, '%Y-%m-%dT%H:%M')
-        utc_start_date = brasilia_to_utc(date_obj.strftime('%Y-%m-%d %H:%M:%S'))
-        status = check_coordinate_for_obs_angle(ra, dec, utc_start_date)
-        allowed = status[0]
-        distance = status[1]
-        sio.emit('coordcheckedondate', {'allowed': allowed, 'distance': distance}, room=sid)
-    except:
-        sio.emit('coordcheckedondate', {'allowed': False, 'distance': 0}, room=sid)
+    _queue_check(sid, 'checkcoordondate', data)
 
 @sio.event
 def check_telescope_status(sid, data):
-    tel = Telescope.objects.filter(name=settings.DB_NAME).values().first()
-    
-    sio.emit('telescope_status', tel, room=sid)
-    
+    # Kept for clients that still ask, the state comes from memory
+    sio.emit('telescope_status', telescope_snapshot(), room=sid)
+
+def push_telescope_status():
+    """
+    Send the fields of the telescope that changed to every authenticated client,
+    as ``telescope_status_diff`` events, and the progress of the running
+    document as ``plan_progress`` events (None when it ends). Runs in the
+    server's own async mode, as the changes are published by other threads
+    (see `base.notifier`).
+    """
+    while True:
+        sio.sleep(STATUS_PUSH_INTERVAL)
+        try:
+            diff = pop_telescope_diff()
+            if diff:
+                sio.emit('telescope_status_diff', diff, room=TELESCOPE_ROOM)
+            changed, progress = pop_progress()
+            if changed:
+                sio.emit('plan_progress', progress, room=TELESCOPE_ROOM)
+        except Exception as e:
+            print(f"Could not push the telescope status: {e}")
+
 @sio.event
 def disconnect(sid):
+    with _checks_lock:
+        for event in COORD_CHECKS:
+            _pending_checks.pop((sid, event), None)
     print('Disconnected:', sid)
+
+# Start the status push when the server starts
+sio.start_background_task(push_telescope_status)
@@ -21,4 +21,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'argus_server.settings')
 django_app = get_wsgi_application()
 application = Middleware(sio, django_app)
 
+# Warm up the astronomy workers while the server starts
+from base.astropool import astronomy_pool
+astronomy_pool.start()
+
 eventlet.wsgi.server(eventlet.listen(('', 8000)), application)
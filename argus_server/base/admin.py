@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Telescope, ObservationPlan
+from .models import InstructionResult, Telescope, ObservationPlan
 
 # Register your models here.
 admin.site.register(Telescope)
-admin.site.register(ObservationPlan)
\ No newline at end of file
+admin.site.register(ObservationPlan)
+admin.site.register(InstructionResult)
@@ -0,0 +1,274 @@
+"""
+Pool of worker processes for the astronomy of the request handlers.
+
+`check_coordinate_for_obs_angle`, `check_plan_ok` and `get_body_coords` are
+pure CPU work (astropy, ephem, skyfield) that holds the GIL, so running them in
+the request threads makes every other request wait. `AstronomyPool` runs them
+in ``astronomy_workers`` processes instead, so the checks of many users use
+every core of the control machine.
+
+The workers are started once and kept warm: each one sets up Django, loads the
+ephemeris, the timescale and the planet table, and runs a first check so astropy
+and ephem are initialized before any request arrives. Calls are sent in batches
+(`AstronomyPool.run_batch`), split between the workers, one message per worker.
+
+Calls run inline, in the calling thread, when the pool is disabled
+(``astronomy_workers = 0``) or not started, while the workers are still warming
+up, or when a worker died (the pool is started again). The results are the
+same either way. Workers that fail to start are replaced after `START_RETRY`
+seconds. The planets are only preloaded when the ephemeris file is already
+there; otherwise it is downloaded by the first call that needs it. A batch the
+workers do not answer in ``astronomy_timeout_seconds`` raises `TimeoutError`
+(it is not run again inline, the workers are busy or stuck and the request
+would pay twice).
+
+The eventlet server does not monkey patch, so a plain wait would block the OS
+thread running the hub, and every client with it. From a green thread the
+waits and the inline calls go through ``eventlet.tpool`` instead, and only the
+calling request waits.
+
+This module is imported by the workers themselves, so nothing is started at
+import: the servers call `AstronomyPool.start` (see ``wsgi.py`` and ``asgi.py``).
+Elsewhere (management commands, tests, scripts) every call runs inline.
+"""
+
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+# Functions of base.auxiliares the workers can run
+FUNCTIONS = ('check_coordinate_for_obs_angle', 'check_plan_ok', 'get_body_coords')
+START_RETRY = 60  # Seconds before starting again a pool whose workers failed to start
+
+
+def _warm_worker():
+    """Initializer of the workers: set up Django and preload the astronomy."""
+    import django
+    django.setup()
+
+    from base.auxiliares import check_coordinate_for_obs_angle
+    from base.ephemeris import get_planet_table, get_planets, get_timescale
+    get_timescale()
+    check_coordinate_for_obs_angle(0.0, 0.0)
+
+    # Best effort: without the ephemeris file (every worker would download it) or if it
+    # can not be read, the planets are loaded on the first call that needs them
+    if os.path.exists(settings.EPHEMERIS_FILE):
+        try:
+            get_planets()
+            get_planet_table()
+        except Exception as e:
+            print(f"Astronomy pool: could not preload the planets: {e}")
+
+
+def _run_batch(calls):
+    """
+    Run a batch of calls in a worker.
+
+    Returns:
+        list: (True, result) or (False, exception) of every call, in order.
+    """
+    from base import auxiliares
+
+    results = []
+    for name, args in calls:
+        try:
+            results.append((True, getattr(auxiliares, name)(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+def _ping():
+    return True
+
+
+def _in_green_thread():
+    """True when running in a green thread of the eventlet server."""
+    if 'eventlet' not in sys.modules:
+        return False
+    from eventlet import greenthread
+    return isinstance(greenthread.getcurrent(), greenthread.GreenThread)
+
+
+def _blocking(function, *args):
+    """Call a blocking ``function``, in a real thread when called from a green thread."""
+    if _in_green_thread():
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    return function(*args)
+
+
+class AstronomyPool:
+    """
+    Warm worker processes running the functions of `FUNCTIONS`.
+
+    Parameters
+    ----------
+    workers : int
+        Number of processes (0 runs every call inline).
+    timeout : float
+        Seconds to wait for a batch before raising `TimeoutError`.
+    """
+
+    def __init__(self, workers=2, timeout=10):
+        self.workers = max(int(workers), 0)
+        self.timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._ready = threading.Event()
+        self._retry = None
+        # Futures submitted and not done, cancelled when the pool is stopped
+        self._pending = set()
+
+    def start(self):
+        """Start and warm up the workers (in the background, calls run inline meanwhile)."""
+        if self.workers == 0 or multiprocessing.parent_process() is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._retry = None
+            # Spawned, the server process runs threads (and eventlet) that must not be forked
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_worker,
+            )
+            executor = self._executor
+            warmups = [executor.submit(_ping) for _ in range(self.workers)]
+
+        def set_ready():
+            done, _ = wait(warmups)
+            errors = [future.exception() for future in done if future.exception() is not None]
+            if not errors:
+                with self._lock:
+                    if self._executor is executor:
+                        self._ready.set()
+                print(f"Astronomy pool: {self.workers} workers ready")
+                return
+
+            print(f"Astronomy pool: the workers failed to start ({errors[0]}), "
+                  f"running inline and retrying in {START_RETRY:.0f} s")
+            with self._lock:
+                if self._executor is not executor:
+                    return
+                self._executor = None
+                self._retry = threading.Timer(START_RETRY, self.start)
+                self._retry.daemon = True
+                self._retry.start()
+            self._stop(executor)
+
+        threading.Thread(target=set_ready, daemon=True).start()
+
+    def _submit(self, executor, function, *args):
+        future = executor.submit(function, *args)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _stop(self, executor):
+        """Shut down ``executor`` in the background, cancelling the calls not started yet."""
+        # shutdown(cancel_futures=True) needs Python 3.9
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+        # Waiting in a thread: shutdown(wait=False) closes pipes the pool still uses on Python 3.8
+        threading.Thread(target=executor.shutdown, daemon=True).start()
+
+    def _restart(self, executor):
+        """Replace a broken pool (a worker died)."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._ready.clear()
+        self._stop(executor)
+        self.start()
+
+    def run_batch(self, calls):
+        """
+        Run a batch of calls, in the workers when they are ready, inline otherwise.
+
+        Args:
+            calls (list): (function name, args) tuples, the names from `FUNCTIONS`.
+
+        Returns:
+            list: The result of every call, in order.
+
+        Raises:
+            TimeoutError: If the workers did not answer in time.
+            Exception: The exception of the first call that failed, as inline.
+        """
+        for name, _ in calls:
+            if name not in FUNCTIONS:
+                raise ValueError(f"{name} can not run in the astronomy pool")
+        if not calls:
+            return []
+
+        results = None
+        executor = self._executor
+        if executor is not None and self._ready.is_set():
+            results = self._run_in_workers(executor, calls)
+        if results is None:
+            results = _blocking(_run_batch, calls)
+
+        for ok, value in results:
+            if not ok:
+                raise value
+        return [value for _, value in results]
+
+    def _run_in_workers(self, executor, calls):
+        """Results of `_run_batch`, or None if the pool could not run them."""
+        size = -(-len(calls) // self.workers)
+        chunks = [calls[i:i + size] for i in range(0, len(calls), size)]
+        deadline = time.monotonic() + self.timeout
+        try:
+            futures = [self._submit(executor, _run_batch, chunk) for chunk in chunks]
+            results = []
+            for future in futures:
+                results.extend(_blocking(future.result, max(deadline - time.monotonic(), 0)))
+            return results
+        except concurrent.futures.TimeoutError:
+            for future in futures:
+                future.cancel()
+            print(f"Astronomy pool: no answer in {self.timeout:.0f} s")
+            # Not the builtin TimeoutError before Python 3.11
+            raise TimeoutError(f"The astronomy pool did not answer in {self.timeout:.0f} s") from None
+        except BrokenProcessPool:
+            print("Astronomy pool: a worker died, restarting the pool")
+            self._restart(executor)
+        except Exception as e:
+            # The calls themselves never raise here, only the transport (pickling, shutdown)
+            print(f"Astronomy pool: {e}, running inline")
+        return None
+
+    def run(self, name, *args):
+        """Run a single call (see `run_batch`)."""
+        return self.run_batch([(name, args)])[0]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._ready.clear()
+            if self._retry is not None:
+                self._retry.cancel()
+                self._retry = None
+        if executor is not None:
+            self._stop(executor)
+
+
+astronomy_pool = AstronomyPool(workers=settings.ASTRONOMY_WORKERS, timeout=settings.ASTRONOMY_TIMEOUT)
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 from astropy.coordinates import SkyCoord
 from astropy import units as u
 import os
@@ -8,31 +9,10 @@ import ephem
 import time
 
 import numpy as np
-from skyfield.api import utc
 
 from django.conf import settings
-from skyfield.api import load
 
-# Load ephemeris data
-planets = load('de421.bsp')  # JPL's DE421 ephemeris for major solar system bodies
-
-# Time scale for current time
-ts = load.timescale()
-
-# Dictionary of bodies in ephemeris files
-bodies = {
-    "Mercury": planets['mercury'],
-    "Venus": planets['venus'],
-    "Moon": planets['moon'],
-    "Mars": planets['mars'],
-    "Jupiter": planets['jupiter barycenter'],
-    "Saturn": planets['saturn barycenter'],
-    "Uranus": planets['uranus barycenter'],
-    "Neptune": planets['neptune barycenter']
-}
-
-# Set up observer position (e.g., Earth's center)
-observer = planets['earth']
+from base.ephemeris import get_body, get_observer, get_planet_table, get_timescale
 
 def _check_units(ra, dec):
     # Pattern to match: any letter (a-z, A-Z) or "°"
@@ -55,11 +35,54 @@ def _check_units(ra, dec):
     
     return ra, dec
 
-def convert_coord_to_degrees(ra, dec):
+_NUMBER = r'(\d+(?:\.\d*)?|\.\d+)'
+
+# Decimal or sexagesimal angles: "161.27", "12.5h", "12h30m0s", "12h 33.5m",
+# "+30d45m45s", "0° 49'", "12:30:00", "12 30 00"
+_ANGLE_PATTERN = re.compile(
+    r'\s*([+-]?)\s*' + _NUMBER + r'\s*([hd°:]?)'
+    r'(?:\s*' + _NUMBER + r"\s*([m':]?)"
+    r'(?:\s*' + _NUMBER + r'\s*(?:s|")?)?)?\s*'
+)
+
+@lru_cache(maxsize=4096)
+def _parse_angle(text):
     """
-    Convert the coordinate to degrees.
-    This should be called before any specific function that requires coordinates.
+    Parse an angle string to degrees.
+
+    Hours are used only when the first field ends with "h", anything else
+    (no unit, "d", "°" or colon separated fields) is in degrees, the same
+    interpretation SkyCoord gives after `_check_units`.
+
+    Returns None for formats not handled here.
     """
+    match = _ANGLE_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    sign, first, unit, minutes, _, seconds = match.groups()
+
+    value = float(first)
+    if minutes is not None:
+        minutes = float(minutes)
+        seconds = float(seconds) if seconds is not None else 0.0
+        if minutes >= 60 or seconds >= 60:
+            return None
+        value += minutes / 60.0 + seconds / 3600.0
+
+    if unit == 'h':
+        value *= 15.0
+    return -value if sign == '-' else value
+
+def _angle_to_degrees(value):
+    """Degrees of a float or string angle, or None when it needs SkyCoord."""
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        return _parse_angle(value)
+    return None
+
+def _skycoord_to_degrees(ra, dec):
+    """Conversion of any format understood by astropy, used for exotic input."""
     ra, dec = _check_units(ra, dec)
 
     # Create a SkyCoord object
@@ -68,21 +91,66 @@ def convert_coord_to_degrees(ra, dec):
     # Return RA and Dec in degrees
     return c.ra.deg, c.dec.deg
 
+def convert_coord_to_degrees(ra, dec):
+    """
+    Convert the coordinate to degrees.
+    This should be called before any specific function that requires coordinates.
+
+    Floats, decimal strings and the usual sexagesimal formats ("12h30m0s",
+    "+30d45m45s", "12.5h", "12:30:00") are parsed directly; anything else is
+    handed to SkyCoord. RA is wrapped to [0, 360) and Dec must be in [-90, 90].
+    """
+    ra_deg = _angle_to_degrees(ra)
+    dec_deg = _angle_to_degrees(dec)
+    if ra_deg is None or dec_deg is None:
+        return _skycoord_to_degrees(ra, dec)
+
+    if not -90.0 <= dec_deg <= 90.0:
+        raise ValueError(f"Latitude angle(s) must be within -90 deg <= angle <= 90 deg, got {dec_deg} deg")
+
+    return ra_deg % 360.0, dec_deg
+
 
 def get_body_coords(body_name, time_obs):
-    """Returns the RA and Dec of a celestial body in degrees."""
+    """
+    Returns the RA and Dec of a celestial body in degrees.
+
+    Uses the precomputed planet table when it covers ``time_obs`` and falls back
+    to a full skyfield computation otherwise.
+    """
+    table = get_planet_table()
+    if table is not None:
+        jd = _to_julian_date(time_obs)
+        if table.covers(jd):
+            ra, dec = table.interpolate(body_name, jd)
+            return float(ra), float(dec)
+
     # Get current time
-    current_time = ts.from_datetime(time_obs)
+    current_time = get_timescale().from_datetime(time_obs)
     
     # Get the body's astrometric position relative to the observer
-    body = bodies[body_name]
-    astrometric = observer.at(current_time).observe(body)
+    body = get_body(body_name)
+    astrometric = get_observer().at(current_time).observe(body)
     ra, dec, distance = astrometric.radec()
 
     # Return RA and Dec in degrees
     return ra._degrees, dec.degrees 
 
 
+def get_body_coords_track(body_name, utctimes):
+    """
+    Returns the RA and Dec arrays (degrees) of a celestial body along an array of UTC times.
+    """
+    jd = _to_julian_date(utctimes)
+    table = get_planet_table()
+    if table is not None and table.covers(jd):
+        return table.interpolate(body_name, jd)
+
+    times = get_timescale().utc(1970, 1, 1, 0, 0, (np.asarray(jd) - 2440587.5) * 86400.0)
+    ra, dec, distance = get_observer().at(times).observe(get_body(body_name)).radec()
+    return ra._degrees, dec.degrees
+
+
 def check_plan_ok(plan, now=False):
     """
     Check if a given observation plan is valid.
@@ -102,7 +170,7 @@ def check_plan_ok(plan, now=False):
         plan.start_time = datetime.utcnow()
     
     if plan.object_name is not None:
-        ra, dec = get_body_coords(plan.object_name, plan.start_time.replace(tzinfo=utc))
+        ra, dec = get_body_coords(plan.object_name, plan.start_time.replace(tzinfo=pytz.utc))
     else:
         ra = plan.ra
         dec = plan.dec
@@ -110,19 +178,21 @@ def check_plan_ok(plan, now=False):
     allowed, distance, altitude, azimuth = check_coordinate_for_obs_angle(ra, dec, plan.start_time)
     return allowed, distance, altitude, azimuth
 
-def get_alt_az(ra_deg, dec_deg, latitude=settings.LAT, longitude=settings.LON, utctime=datetime.utcnow()):
+def get_alt_az(ra_deg, dec_deg, latitude=settings.LAT, longitude=settings.LON, utctime=None):
     """
     Calculate the altitude and azimuth for given RA and Dec using the provided observer.
 
     Parameters:
     - ra_deg: Right Ascension in degrees.
     - dec_deg: Declination in degrees.
-    - observer: ephem.Observer object.
+    - utctime: UTC time of the observation. Default is the current UTC time.
     
     Returns:
     - altitude: Altitude in degrees.
     - azimuth: Azimuth in degrees.
     """
+    if utctime is None:
+        utctime = datetime.utcnow()
 
     # Create a FixedBody for the given RA and Dec
     target = ephem.FixedBody()
@@ -141,7 +211,7 @@ def get_alt_az(ra_deg, dec_deg, latitude=settings.LAT, longitude=settings.LON, u
     return float(target.alt) * 180 / np.pi, float(target.az) * 180 / np.pi
 
 
-def get_abovesky_coordinates(latitude=settings.LAT, longitude=settings.LON, utctime=datetime.utcnow()):
+def get_abovesky_coordinates(latitude=settings.LAT, longitude=settings.LON, utctime=None):
     """
     Calculate the right ascension and declination coordinates of the observer.
 
@@ -161,6 +231,9 @@ def get_abovesky_coordinates(latitude=settings.LAT, longitude=settings.LON, utct
     dec_degrees : float
         The declination coordinate of the observer in degrees.
     """
+    if utctime is None:
+        utctime = datetime.utcnow()
+
     observer = ephem.Observer()
     observer.lat = str(latitude)
     observer.lon = str(longitude)
@@ -245,7 +318,7 @@ def angular_distance_astropy(ra1, dec1, ra2, dec2):
 
     return sep.deg
 
-def check_coordinate_for_obs_angle(ra, dec, utctime=datetime.utcnow()):
+def check_coordinate_for_obs_angle(ra, dec, utctime=None):
     """
     Check if a given coordinate is within the maximum distance from the zenith.
 
@@ -263,6 +336,9 @@ def check_coordinate_for_obs_angle(ra, dec, utctime=datetime.utcnow()):
     bool
         True if the coordinate is within the maximum distance from the zenith, False otherwise.
     """
+    if utctime is None:
+        utctime = datetime.utcnow()
+
     above_ra, above_dec = get_abovesky_coordinates(utctime=utctime)
     above_ra, above_dec = convert_coord_to_degrees(above_ra, above_dec)
     
@@ -280,6 +356,143 @@ def check_coordinate_for_obs_angle(ra, dec, utctime=datetime.utcnow()):
         return False, distance, altitude, azimuth
     return True, distance, altitude, azimuth
 
+def _to_julian_date(utctime):
+    """
+    Convert a UTC datetime, or an array-like of them, to Julian dates.
+
+    Timezone aware datetimes are converted to UTC first, naive ones are assumed
+    to already be in UTC. ``None`` means the current UTC time.
+    """
+    if utctime is None:
+        utctime = datetime.utcnow()
+
+    def _naive_utc(value):
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            return value.astimezone(pytz.utc).replace(tzinfo=None)
+        return value
+
+    if isinstance(utctime, datetime):
+        return (_naive_utc(utctime) - datetime(1970, 1, 1)).total_seconds() / 86400.0 + 2440587.5
+    elif isinstance(utctime, np.ndarray) and np.issubdtype(utctime.dtype, np.datetime64):
+        times = utctime.astype('datetime64[us]')
+    else:
+        times = np.array([_naive_utc(value) for value in np.ravel(np.asarray(utctime, dtype=object))],
+                         dtype='datetime64[us]').reshape(np.shape(utctime))
+
+    seconds = (times - np.datetime64('1970-01-01T00:00:00', 'us')) / np.timedelta64(1, 's')
+    return seconds / 86400.0 + 2440587.5
+
+
+def _local_sidereal_degrees(jd, longitude):
+    """Local mean sidereal time in degrees (IAU 1982 GMST) for Julian dates ``jd``."""
+    d = jd - 2451545.0
+    t = d / 36525.0
+    gmst = 280.46061837 + 360.98564736629 * d + 0.000387933 * t**2 - t**3 / 38710000.0
+    return np.mod(gmst + longitude, 360.0)
+
+
+def _precess_from_j2000(ra, dec, jd):
+    """
+    Precess J2000 equatorial coordinates (radians) to the equinox of date (IAU 1976).
+    """
+    t = (jd - 2451545.0) / 36525.0
+    arcsec = np.pi / (180.0 * 3600.0)
+    zeta = (2306.2181 * t + 0.30188 * t**2 + 0.017998 * t**3) * arcsec
+    z = (2306.2181 * t + 1.09468 * t**2 + 0.018203 * t**3) * arcsec
+    theta = (2004.3109 * t - 0.42665 * t**2 - 0.041833 * t**3) * arcsec
+
+    cos_dec = np.cos(dec)
+    a = cos_dec * np.sin(ra + zeta)
+    b = np.cos(theta) * cos_dec * np.cos(ra + zeta) - np.sin(theta) * np.sin(dec)
+    c = np.sin(theta) * cos_dec * np.cos(ra + zeta) + np.cos(theta) * np.sin(dec)
+    return np.arctan2(a, b) + z, np.arcsin(np.clip(c, -1.0, 1.0))
+
+
+def _refraction_degrees(altitude):
+    """
+    Atmospheric refraction in degrees for a geometric altitude in degrees
+    (Saemundsson, 1010 mBar and 15 C, the same defaults ephem uses).
+    """
+    h = np.maximum(altitude, -1.0)
+    refraction = 1.02 / np.tan(np.deg2rad(h + 10.3 / (h + 5.11))) / 60.0
+    return np.where(altitude >= -1.0, refraction * 283.0 / 288.0, 0.0)
+
+
+def _angular_distance(ra1, dec1, ra2, dec2):
+    """Vectorized angular distance (Vincenty formula), all values in degrees."""
+    ra1, dec1, ra2, dec2 = map(np.deg2rad, (ra1, dec1, ra2, dec2))
+    delta = ra2 - ra1
+    sin_dec1, cos_dec1 = np.sin(dec1), np.cos(dec1)
+    sin_dec2, cos_dec2 = np.sin(dec2), np.cos(dec2)
+
+    num1 = cos_dec2 * np.sin(delta)
+    num2 = cos_dec1 * sin_dec2 - sin_dec1 * cos_dec2 * np.cos(delta)
+    denominator = sin_dec1 * sin_dec2 + cos_dec1 * cos_dec2 * np.cos(delta)
+    return np.rad2deg(np.arctan2(np.hypot(num1, num2), denominator))
+
+
+def check_coordinates_for_obs_angle(ra, dec, utctime=None, latitude=settings.LAT, longitude=settings.LON):
+    """
+    Vectorized version of `check_coordinate_for_obs_angle` for whole catalogs.
+
+    Parameters
+    ----------
+    ra : array_like
+        Right ascensions (J2000) in degrees.
+    dec : array_like
+        Declinations (J2000) in degrees.
+    utctime : datetime.datetime or array_like, optional
+        UTC time of the observation, or an array of times. Times are broadcast
+        against the coordinates, so ``ra[:, None]`` with a time array gives a
+        (coordinates x times) grid. Default is the current UTC time.
+    latitude : float, optional
+        The latitude of the observer in degrees. Default is the value in settings.LAT.
+    longitude : float, optional
+        The longitude of the observer in degrees. Default is the value in settings.LON.
+
+    Returns
+    -------
+    allowed : numpy.ndarray
+        Boolean array, True where the coordinate is observable with the same
+        limits used by `check_coordinate_for_obs_angle`.
+    distance : numpy.ndarray
+        Angular distance from the zenith in degrees.
+    altitude : numpy.ndarray
+        Altitude in degrees (refraction included, as in ephem).
+    azimuth : numpy.ndarray
+        Azimuth in degrees, measured from north through east.
+    """
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+    jd = _to_julian_date(utctime)
+
+    lat = np.deg2rad(float(latitude))
+    lst = _local_sidereal_degrees(jd, float(longitude))
+
+    # Zenith distance, computed the same way as the scalar path (sidereal time vs. latitude)
+    distance = _angular_distance(ra, dec, lst, np.rad2deg(lat))
+
+    # Horizontal coordinates for the equinox of date
+    ra_date, dec_date = _precess_from_j2000(np.deg2rad(ra), np.deg2rad(dec), jd)
+    hour_angle = np.deg2rad(lst) - ra_date
+
+    sin_alt = np.sin(dec_date) * np.sin(lat) + np.cos(dec_date) * np.cos(lat) * np.cos(hour_angle)
+    altitude = np.rad2deg(np.arcsin(np.clip(sin_alt, -1.0, 1.0)))
+    altitude = altitude + _refraction_degrees(altitude)
+
+    azimuth = np.arctan2(
+        -np.cos(dec_date) * np.sin(hour_angle),
+        np.cos(lat) * np.sin(dec_date) - np.sin(lat) * np.cos(dec_date) * np.cos(hour_angle),
+    )
+    azimuth = np.mod(np.rad2deg(azimuth), 360.0)
+
+    allowed = (
+        (altitude >= settings.MIN_ZENITH) & (altitude <= settings.MAX_ZENITH)
+        & (azimuth <= settings.MAX_AZIMUTH) & (azimuth >= settings.MIN_AZIMUTH)
+        & (distance < settings.MAX_DISTANCE_FROM_ZENITH)
+    )
+    return allowed, distance, altitude, azimuth
+
 def files_in_directory(directory):
     """
     Returns a list of file names in the specified directory.
@@ -1,14 +1,27 @@
 from datetime import datetime
+import json
 import threading
 import time
 import os
 
+from base import handoff
 from base.auxiliares import files_in_directory, utc_to_brasilia
 from base.executeobs import get_orchestrate_filename
-from base.models import ObservationPlan, Telescope
+from base.models import InstructionResult, ObservationPlan
+from base.notifier import publish_progress
+from base.orclog import output_files, parse_orc_file
+from base.progress import PlanProgress, find_result_document
+from base.telescopestate import IDLE_STATE, telescope_state
+from base.watcher import OrchestrateWatcher
 
 from django.conf import settings
 
+TAXA_ATUALIZACAO = 1  # Polling interval in seconds, when file events are not available
+N_SECONDS = 10  # Seconds a file can stay in the orchestrate folder before orchestrate is considered not watching
+IDLE_WAKEUP = 30  # Re-read the telescope register at least this often
+ORC_SETTLE = 1  # Seconds a result document must stay unchanged before it is read, as orchestrate may still be writing it
+PROGRESS_REFRESH = 10  # Publish the progress at least this often while a document runs, to correct the ETA
+
 
 """
 TODO: Copy this to the docs 
@@ -24,70 +37,227 @@ possible staus telescope
 ]
 """
 
-def check_telescope_register():
-    tel = Telescope.objects.filter(name=settings.DB_NAME).first()
-    if tel:
-        tel.delete()
-        del tel
-    tel = Telescope(name=settings.DB_NAME)
-    reset_telescope_register(tel)
-    tel.save()
-        
-def reset_telescope_register(telescope):
-    telescope.ra = 0
-    telescope.dec = 0
-    telescope.alt = 0
-    telescope.az = 0
-    telescope.status = "idle"
-    telescope.operation = None
-    telescope.executing_plan_id = None
-    telescope.executing_plan_name = None
-    telescope.save()
+def recover_telescope_register():
+    """
+    Restore the telescope register when the server starts: the document handed
+    off before a restart and not finished is followed again (see
+    `base.handoff.recover`), otherwise the telescope is idle.
+    """
+    telescope_state.reload()
+    register = handoff.recover()
+    if register is None:
+        telescope_state.reset()
+    else:
+        print(f"Recovered plan {register['executing_plan_id']} handed off before the restart")
+        telescope_state.update(**register)
+
+def reset_telescope_register(telescope, expected=None):
+    """
+    Return the telescope to idle, if its status is still ``expected`` (see
+    `TelescopeState.compare_and_set`), and update the ``telescope`` snapshot.
+
+    Returns:
+        bool: True if the telescope was reset.
+    """
+    if not telescope_state.reset(expected):
+        return False
+    # The document is finished or abandoned, it is not recovered after a restart
+    if telescope.executing_plan_id is not None:
+        _, instructions_path = get_orchestrate_filename(telescope.executing_plan_id)
+        handoff.complete(os.path.basename(instructions_path))
+    for field, value in IDLE_STATE.items():
+        setattr(telescope, field, value)
+    return True
 
 def parse_done_file(file):
     """
-    Parse a DONE file and return the status of the operation.
+    Parse a DONE file and return the images written.
     
     Args:
         file (str): The path of the DONE file.
     
     Returns:
-        str: The status of the operation.
-    """
-    files = []
-    with open(file, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            if line.startswith('TakeImage'):
-                filename = line.split()[3]
-                filename = os.path.basename(filename)
-                files.append(filename)
-    return files
+        list of str: The basenames of the images, in order.
+    """
+    return output_files(parse_orc_file(file))
+
+def _in_typed_order(plan, images):
+    """
+    Order the (filter, filename) images of a plan as its filters were typed, as the
+    optimizer may have taken them in another order (see `base.executeobs.order_filters`).
+    """
+    remaining = list(images)
+    ordered = []
+    for filtro in plan.filters.split(','):
+        for image in remaining:
+            if image[0] == filtro.strip():
+                ordered.append(image[1])
+                remaining.remove(image)
+                break
+    return ordered + [filename for _, filename in remaining]
+
+def _plans_of_document(telescope):
+    """Plan ids of the running document, and the plan of each of its ``TakeImage``."""
+    if telescope.executing_plans:
+        manifest = json.loads(telescope.executing_plans)
+        return manifest['plans'], manifest['images']
+    return [telescope.executing_plan_id], []
+
+def save_instruction_results(telescope, records):
+    """
+    Store the results of the running document as `InstructionResult` rows.
+
+    Each instruction belongs to the plan of the next ``TakeImage`` (the slew,
+    frame mode and filter of a plan come before its images).
+
+    Args:
+        telescope (Telescope): The telescope register.
+        records (list of dict): The results (see `base.orclog.parse_orc_file`).
+
+    Returns:
+        dict: Plan id -> list of its records.
+    """
+    plan_ids, images = _plans_of_document(telescope)
+    by_plan = {plan_id: [] for plan_id in plan_ids}
+
+    n_images = 0
+    rows = []
+    for record in records:
+        if images:
+            plan_id = images[min(n_images, len(images) - 1)]
+        else:
+            plan_id = plan_ids[0]
+        if record['command'] == 'TakeImage':
+            n_images += 1
+        by_plan[plan_id].append(record)
+        rows.append(InstructionResult(
+            plan_id=plan_id,
+            step=record['step'],
+            command=record['command'],
+            arguments=', '.join(record['arguments'])[:100],
+            filename=record['filename'],
+            message=record['message'][:255],
+            error_code=record['error_code'],
+            finished_at=record['timestamp'],
+            duration=record['duration'],
+        ))
+
+    InstructionResult.objects.filter(plan_id__in=plan_ids).delete()
+    InstructionResult.objects.bulk_create(rows)
+    return by_plan
+
+def mark_plans_executed(telescope, records):
+    """
+    Mark the plans of a finished document as executed and store their results and outputs.
+
+    Documents merging several plans carry a manifest (``telescope.executing_plans``)
+    with the plan of each ``TakeImage``, used to give every plan its own images.
+    The outputs of each plan follow the order of its filters.
+
+    Args:
+        telescope (Telescope): The telescope register.
+        records (list of dict): The results of the document (see `base.orclog.parse_orc_file`).
+    """
+    by_plan = save_instruction_results(telescope, records)
+
+    executed_at = utc_to_brasilia(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')).replace(tzinfo=None)
+    for plan in ObservationPlan.objects.filter(id__in=list(by_plan)):
+        # Filter in place for each image of the plan
+        images = []
+        current_filter = None
+        for record in by_plan[plan.id]:
+            if record['command'] == 'SetFilter':
+                current_filter = record['arguments'][0] if record['arguments'] else None
+            elif record['command'] == 'TakeImage' and record['filename']:
+                images.append((current_filter, output_files([record])[0]))
+
+        plan.executed = True
+        plan.executed_at = executed_at
+        plan.outputs = ", ".join(_in_typed_order(plan, images))
+        plan.save()
+
+def _is_settled(path):
+    """True if the file was not modified in the last ORC_SETTLE seconds."""
+    try:
+        return time.time() - os.path.getmtime(path) >= ORC_SETTLE
+    except OSError:
+        return False
+
+def update_progress(progress, telescope, now, last_published):
+    """
+    Look for the new frames and results of the running document and publish its
+    progress when the step changed, or every PROGRESS_REFRESH seconds.
+
+    Returns:
+        tuple: (step, time) of the last publication.
+    """
+    orc_name, _ = get_orchestrate_filename(telescope.executing_plan_id)
+    path = find_result_document(settings.ORCHESTRATE_FOLDER, orc_name)
+    if path is not None:
+        progress.follow(path, now)
+    progress.follow_images(settings.IMAGES_FOLDER, now)
+
+    snapshot = progress.snapshot(now)
+    step = (snapshot['step'], snapshot['done'])
+    if last_published is None or step != last_published[0] or now - last_published[1] >= PROGRESS_REFRESH:
+        publish_progress({**snapshot, 'plan_id': telescope.executing_plan_id})
+        return step, now
+    return last_published
+
+def _next_wakeup(now, file_first_seen, handshake_since, status, settling=False, progress=None):
+    """
+    Seconds until the next time-based transition of the state machine
+    (file stuck in the orchestrate folder, HANDSHAKE recovery, a result
+    document being written, the predicted end of a step or a stall).
+    """
+    deadlines = [now + IDLE_WAKEUP]
+    if settling:
+        deadlines.append(now + ORC_SETTLE)
+    if progress is not None:
+        deadlines.append(now + PROGRESS_REFRESH)
+        deadlines.append(progress.deadline())
+        next_change = progress.next_change(now)
+        if next_change is not None:
+            deadlines.append(now + next_change)
+    for file, first_seen in file_first_seen.items():
+        # A file already stuck for N_SECONDS has no transition left to wait for
+        if file != 'HANDSHAKE' and now - first_seen < N_SECONDS:
+            deadlines.append(first_seen + N_SECONDS)
+    if handshake_since is not None and 'error' in status:
+        deadlines.append(handshake_since + N_SECONDS)
+    # Deadlines already past were handled in this wake-up, waiting on them would spin
+    deadlines = [deadline for deadline in deadlines if deadline > now]
+    return max(min(deadlines) - now, 0.05)
 
 def check_telescope():
-    file_track_dict = {}
-    N = 10
-    previous_files = set()  # Store files from the previous iteration
-    current_iteration = 0
-    handshake_count = 0
-    operation_count = 0
+    file_first_seen = {}  # file -> time it was first seen in the orchestrate folder
+    previous_files = set()  # Store files from the previous wake-up
+    handshake_since = None
+    operation_started = None
+    progress = None  # PlanProgress of the running document
+    last_published = None
 
     print('Starting background task')
-    taxa_atualizacao = 1
-    check_telescope_register()
+    recover_telescope_register()
+
+    watcher = OrchestrateWatcher(settings.ORCHESTRATE_FOLDER, mode=settings.ORCHESTRATE_WATCHER, poll_interval=TAXA_ATUALIZACAO)
+    watcher.start()
+
     while True:
-        # Your database update logic here
-        telescope = Telescope.objects.get(name=settings.DB_NAME)
-        
+        now = time.monotonic()
+        telescope = telescope_state.get_instance()
+        status = telescope.status
+
         # Get the list of files in the directory
-        fs_orchestrate_folder = files_in_directory(settings.ORCHESTRATE_FOLDER)
-        for file in fs_orchestrate_folder:
+        fs_orchestrate_folder = []
+        for file in files_in_directory(settings.ORCHESTRATE_FOLDER):
             if file.startswith('.'):
                 try: os.remove(os.path.join(settings.ORCHESTRATE_FOLDER, file))
                 except: pass
-                fs_orchestrate_folder.remove(file)
-        
-        # Detect files that disappeared before N iterations
+                continue
+            fs_orchestrate_folder.append(file)
+
+        # Detect if the instructions were picked up by orchestrate
         if 'Sending' in telescope.status:
             orc_name, _ = get_orchestrate_filename(telescope.executing_plan_id)
             found = False
@@ -97,101 +267,114 @@ def check_telescope():
                     break
             if not found:
                 telescope.status = "executing operations"
-                telescope.save()
-        
+                operation_started = now
+
+        # Detect files that disappeared before N seconds
         for file in previous_files:
             if 'error' in telescope.status:
                 continue
             if telescope.status == "executing operations":
                 continue
             if file not in fs_orchestrate_folder:
-                iterations_present = current_iteration - file_track_dict[file]['first_appearance']
-                if iterations_present <= N:
-                    ## extract plan_id from file name
+                if now - file_first_seen[file] <= N_SECONDS:
                     telescope.status = "executing operations"
-                    operation_count = 0
-                    telescope.save()
-                    
-                # Remove file from tracking
-                del file_track_dict[file]
-        
+                    operation_started = now
+
         if 'idle' in telescope.status:
-            operation_count = 0
-        
-        # Update file appearance and counts
+            operation_started = None
+
+        # Update file appearance
         for file in fs_orchestrate_folder:
-            if file not in file_track_dict:
-                file_track_dict[file] = {'first_appearance': current_iteration, 'count': 1}
-            else:
-                file_track_dict[file]['count'] += taxa_atualizacao
-            
-            if file_track_dict[file]['count'] >= N and file != 'HANDSHAKE':
-                # File has been present for more than {N} iterations!
+            first_seen = file_first_seen.setdefault(file, now)
+            if now - first_seen >= N_SECONDS and file != 'HANDSHAKE':
+                # File has been present for more than {N} seconds!
                 telescope.status = "error - orchestrate not watching"
-                telescope.save()
-            
-        # Reset the count of files no longer present in the directory
-        for file in list(file_track_dict.keys()):
+
+        # Forget files no longer present in the directory
+        for file in list(file_first_seen.keys()):
             if file not in fs_orchestrate_folder:
-                del file_track_dict[file]
+                del file_first_seen[file]
 
         # Check HANDSHAKE file condition
-        if len(fs_orchestrate_folder) == 1 and 'HANDSHAKE' in fs_orchestrate_folder:
-            handshake_count += taxa_atualizacao
-            if handshake_count >= N:
-                #Only the HANDSHAKE file has been present for more than {N} iterations!
-                if "error" in telescope.status:
-                    reset_telescope_register(telescope)
+        if fs_orchestrate_folder == ['HANDSHAKE']:
+            if handshake_since is None:
+                handshake_since = now
+            if now - handshake_since >= N_SECONDS and "error" in telescope.status:
+                # Only the HANDSHAKE file has been present for more than {N} seconds!
+                reset_telescope_register(telescope, status)
+                status = telescope.status
         else:
-            handshake_count = 0  # Reset handshake count if other files are present or HANDSHAKE is absent
-        previous_files = fs_orchestrate_folder
-
-        # Reset the count of files no longer present in the directory
-        for file in list(file_track_dict.keys()):
-            if file not in fs_orchestrate_folder:
-                del file_track_dict[file]
+            handshake_since = None  # Reset if other files are present or HANDSHAKE is absent
+        previous_files = set(fs_orchestrate_folder)
 
-        
         done = False
+        settling = False
         ### If file found in DONE folder, update as done:
         if telescope.status == "executing operations":
-            operation_count += taxa_atualizacao
+            if operation_started is None:
+                operation_started = now
             orc_name, _ = get_orchestrate_filename(telescope.executing_plan_id)
-            
+
             done_folder = os.path.join(settings.ORCHESTRATE_FOLDER, "done")
-            
+
             fs_done_folder = files_in_directory(done_folder)
             for file in fs_done_folder:
                 if orc_name in file and ".ORC" in file:
-                    plan = ObservationPlan.objects.get(id=telescope.executing_plan_id)
-                    plan.executed = True
-                    plan.executed_at = utc_to_brasilia(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')).replace(tzinfo=None)
-                    plan.outputs = str(parse_done_file(os.path.join(done_folder, file))).replace("[", "").replace("]", "").replace("'", "")
-                    plan.save()
-                    
-                    reset_telescope_register(telescope)
-            
+                    if not _is_settled(os.path.join(done_folder, file)):
+                        settling = True
+                        continue
+                    mark_plans_executed(telescope, parse_orc_file(os.path.join(done_folder, file)))
+
+                    reset_telescope_register(telescope, status)
+                    status = telescope.status
+                    operation_started = None
+
                     done = True
-            
+
         ### If file found in ERROR folder, update as error:
         if telescope.status == "executing operations" and done == False:
-            
+
             orc_name, _ = get_orchestrate_filename(telescope.executing_plan_id)
-            
+
             error_folder = os.path.join(settings.ORCHESTRATE_FOLDER, "done", "Errors")
             fs_error_folder = files_in_directory(error_folder)
             for file in fs_error_folder:
                 if orc_name in file and ".ORC" in file:
-                    reset_telescope_register(telescope)
-                    
-        
-        if operation_count > settings.OPERATION_TIMEOUT:
-            telescope.status = "error - timeout"
-            telescope.save()
-            operation_count = 0
-
-        time.sleep(taxa_atualizacao)  # Sleep for 1 second before the next update
-        
+                    if not _is_settled(os.path.join(error_folder, file)):
+                        settling = True
+                        continue
+                    save_instruction_results(telescope, parse_orc_file(os.path.join(error_folder, file)))
+                    reset_telescope_register(telescope, status)
+                    status = telescope.status
+                    operation_started = None
+
+        # Follow the progress of the running document
+        if telescope.status == "executing operations":
+            if progress is None:
+                progress = PlanProgress(telescope.operation, started=operation_started)
+                last_published = None
+            last_published = update_progress(progress, telescope, now, last_published)
+
+            # Orchestrate silent for longer than the pending steps should take
+            if progress.stalled(now):
+                print(f"Plan {telescope.executing_plan_id} stalled after {progress.n_done} of {len(progress.steps)} steps")
+                if progress.parser is not None and progress.parser.records:
+                    save_instruction_results(telescope, progress.parser.records)
+                telescope.status = "error - timeout"
+                operation_started = None
+
+        if telescope.status != "executing operations" and progress is not None:
+            progress = None
+            publish_progress(None)
+
+        # Only change the register when the state actually changed, and only if
+        # nobody else changed it since it was read (e.g. execute_plan)
+        if telescope.status != status:
+            telescope_state.compare_and_set(status, status=telescope.status)
+
+        # Sleep until something changes in the orchestrate folders or a deadline is due
+        watcher.wait(_next_wakeup(time.monotonic(), file_first_seen, handshake_since, telescope.status, settling, progress))
+
 # Start the background thread when Django starts
 thread = threading.Thread(target=check_telescope)
 thread.daemon = True  # This makes sure the thread will exit when the main program exits
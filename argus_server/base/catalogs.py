@@ -0,0 +1,110 @@
+"""
+In-memory cache for the pre-saved catalog shown in the observation page.
+
+The catalog CSV is parsed once, with coordinates already in degrees, and the
+list of observable objects is computed once per time bucket and kept as a ready
+to send JSON payload, so every client polling in the same bucket gets the same
+answer without re-running any astronomy.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from base.auxiliares import check_coordinates_for_obs_angle, convert_coord_to_degrees
+
+MESSIER_CATALOG = os.path.join(os.path.dirname(__file__), 'documents', 'final_messier.csv')
+
+
+class ObservableCatalogCache:
+    """
+    Time-bucketed LRU cache of the observable objects of a catalog.
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV catalog, with ``RA`` and ``DEC`` columns.
+    bucket_seconds : float
+        Size of the time bucket. Every request in the same bucket shares the result.
+    max_buckets : int
+        Maximum number of buckets kept in memory (least recently used are evicted).
+    """
+
+    def __init__(self, path, bucket_seconds=60, max_buckets=32):
+        self.path = path
+        self.bucket_seconds = max(float(bucket_seconds), 1.0)
+        self.max_buckets = max(int(max_buckets), 1)
+
+        self._lock = threading.Lock()
+        self._records = None
+        self._ra = None
+        self._dec = None
+        self._payloads = OrderedDict()
+
+    def _load(self):
+        """Parse the catalog once and keep the coordinates in degrees."""
+        df = pd.read_csv(self.path)
+
+        # The catalog mixes decimal degrees and sexagesimal strings, the payload
+        # keeps the original values and only the arrays are in degrees.
+        coords = [convert_coord_to_degrees(ra, dec) for ra, dec in zip(df['RA'], df['DEC'])]
+
+        self._records = df.to_dict(orient='records')
+        self._ra = np.array([ra for ra, _ in coords], dtype=float)
+        self._dec = np.array([dec for _, dec in coords], dtype=float)
+
+    def _bucket(self, utctime):
+        if utctime is None:
+            timestamp = time.time()
+        else:
+            timestamp = (utctime - datetime(1970, 1, 1)).total_seconds()
+        return int(timestamp // self.bucket_seconds)
+
+    def get_payload(self, utctime=None):
+        """
+        Return the JSON payload (str) of the objects observable at ``utctime``.
+
+        Parameters
+        ----------
+        utctime : datetime.datetime, optional
+            Naive UTC time. Default is the current UTC time.
+        """
+        bucket = self._bucket(utctime)
+
+        with self._lock:
+            if bucket in self._payloads:
+                self._payloads.move_to_end(bucket)
+                return self._payloads[bucket]
+
+            if self._records is None:
+                self._load()
+
+            bucket_time = datetime.utcfromtimestamp(bucket * self.bucket_seconds)
+            allowed, _, _, _ = check_coordinates_for_obs_angle(self._ra, self._dec, bucket_time)
+            payload = json.dumps([self._records[i] for i in np.flatnonzero(allowed)])
+
+            self._payloads[bucket] = payload
+            while len(self._payloads) > self.max_buckets:
+                self._payloads.popitem(last=False)
+
+            return payload
+
+    def clear(self):
+        """Drop the parsed catalog and every cached payload."""
+        with self._lock:
+            self._records = None
+            self._payloads.clear()
+
+
+messier_catalog = ObservableCatalogCache(
+    MESSIER_CATALOG,
+    bucket_seconds=settings.CATALOG_CACHE_BUCKET,
+    max_buckets=settings.CATALOG_CACHE_SIZE,
+)
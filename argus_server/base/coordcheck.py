@@ -0,0 +1,135 @@
+"""
+Memo of the coordinate checks asked by the observation page.
+
+The page asks ``checkcoord`` / ``checkcoordondate`` on every keystroke while
+the user types a coordinate, and each check runs the whole
+`base.auxiliares.check_coordinate_for_obs_angle` pipeline. Checks are keyed by
+the coordinate in degrees, rounded to ``coord_check_decimals``, and by a time
+bucket of ``coord_check_bucket_seconds``: the coordinate is evaluated at the
+start of the bucket, so every client asking the same thing in the same bucket
+shares one computation, and the answer is never older than one bucket.
+
+`check_now` and `check_on_date` answer the socket events, for both the eventlet
+(`argus_server.socket`) and the ASGI (`argus_server.asyncsocket`) servers.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import time
+
+import pytz
+from django.conf import settings
+
+from base.astropool import astronomy_pool
+from base.auxiliares import brasilia_to_utc, convert_coord_to_degrees
+
+
+class CoordinateCheckCache:
+    """
+    Time-bucketed LRU memo of `check_coordinate_for_obs_angle`.
+
+    Parameters
+    ----------
+    bucket_seconds : float
+        Size of the time bucket.
+    max_size : int
+        Maximum number of checks kept in memory (least recently used are evicted).
+    decimals : int
+        Decimals of the coordinates in degrees kept in the key.
+    """
+
+    def __init__(self, bucket_seconds=10, max_size=4096, decimals=3):
+        self.bucket_seconds = max(float(bucket_seconds), 1.0)
+        self.max_size = max(int(max_size), 1)
+        self.decimals = int(decimals)
+
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def _bucket(self, utctime):
+        if utctime is None:
+            timestamp = time.time()
+        else:
+            if utctime.tzinfo is not None:
+                utctime = utctime.astimezone(pytz.utc).replace(tzinfo=None)
+            timestamp = (utctime - datetime(1970, 1, 1)).total_seconds()
+        return int(timestamp // self.bucket_seconds)
+
+    def check(self, ra, dec, utctime=None):
+        """
+        Check if the coordinate is observable at ``utctime``.
+
+        Parameters
+        ----------
+        ra, dec : float or str
+            The coordinate, in any format accepted by `convert_coord_to_degrees`.
+        utctime : datetime.datetime, optional
+            UTC time (naive or aware). Default is the current UTC time.
+
+        Returns
+        -------
+        tuple
+            (allowed, distance from the zenith in degrees).
+        """
+        ra, dec = convert_coord_to_degrees(ra, dec)
+        key = (round(ra, self.decimals), round(dec, self.decimals), self._bucket(utctime))
+
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        bucket_time = datetime.utcfromtimestamp(key[2] * self.bucket_seconds)
+        allowed, distance, _, _ = astronomy_pool.run('check_coordinate_for_obs_angle', key[0], key[1], bucket_time)
+        result = bool(allowed), float(distance)
+
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+coordinate_checks = CoordinateCheckCache(
+    bucket_seconds=settings.COORD_CHECK_BUCKET,
+    max_size=settings.COORD_CHECK_CACHE_SIZE,
+    decimals=settings.COORD_CHECK_DECIMALS,
+)
+
+
+def check_now(data):
+    """Answer of a ``checkcoord`` event: is the coordinate observable now."""
+    try:
+        allowed, distance = coordinate_checks.check(data['ra'], data['dec'])
+        return {'allowed': allowed, 'distance': distance}
+    except:
+        return {'allowed': False, 'distance': 0}
+
+
+def check_on_date(data):
+    """Answer of a ``checkcoordondate`` event: is the coordinate (or object) observable at the date."""
+    try:
+        date = data['date']
+        date_obj = datetime.strptime(date, '%Y-%m-%dT%H:%M')
+        utc_start_date = brasilia_to_utc(date_obj.strftime('%Y-%m-%d %H:%M:%S'))
+        if data.get('object_name'):
+            ra, dec = astronomy_pool.run('get_body_coords', data['object_name'], utc_start_date)
+        else:
+            ra = data['ra']
+            dec = data['dec']
+        allowed, distance = coordinate_checks.check(ra, dec, utc_start_date)
+        return {'allowed': allowed, 'distance': distance}
+    except:
+        return {'allowed': False, 'distance': 0}
+
+
+# Coordinate check events of the socket: event -> (check, answer event)
+COORD_CHECKS = {
+    'checkcoord': (check_now, 'coordchecked'),
+    'checkcoordondate': (check_on_date, 'coordcheckedondate'),
+}
@@ -13,9 +13,12 @@ def require_keys(*required_keys):
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
-            # Assuming you're dealing with a JSON payload
+            # Assuming you're dealing with a JSON payload, GET requests use the query string
             try:
-                payload = request.json() if hasattr(request, 'json') else request.data
+                if request.method in ('GET', 'HEAD'):
+                    payload = request.GET
+                else:
+                    payload = request.json() if hasattr(request, 'json') else request.data
             except ValueError:
                 return JsonResponse({'error': 'Invalid JSON payload'}, status=400)
             
@@ -0,0 +1,336 @@
+"""
+Streaming downloads of the images folder.
+
+Files are sent in blocks straight from disk (`BlockFileResponse`, or a generator
+for byte ranges and gzip), so the memory used by a download does not depend on
+the size of the file. Interrupted downloads can be resumed with HTTP ``Range``
+requests, and ``ETag`` / ``Last-Modified`` let clients skip files they already
+have. Several files can be sent as a single zip or tar archive
+(`stream_archive`), also built while it is sent.
+
+The responses are sync iterators, read block by block by the eventlet WSGI
+server. On ASGI Django's ``StreamingHttpResponse`` and ``FileResponse`` would
+read them whole before sending them, so `BlockStreamingResponse` and
+`BlockFileResponse` read one block at a time in the threads of
+`_block_executor` instead.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import tarfile
+import zipfile
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+BLOCK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+# Extensions worth compressing on the fly (FITS frames compress well, PNG/JPEG do not)
+GZIP_EXTENSIONS = ('.fit', '.fits', '.fts')
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Threads reading the blocks of the responses on ASGI (no thread is started on WSGI)
+_block_executor = ThreadPoolExecutor(max_workers=settings.ASGI_THREADS, thread_name_prefix='download-blocks')
+
+
+class _BlockByBlock:
+    """Streaming response read one block at a time on ASGI."""
+
+    async def __aiter__(self):
+        if self.is_async:
+            async for part in self.streaming_content:
+                yield part
+            return
+
+        iterator = iter(self.streaming_content)
+        read = sync_to_async(next, thread_sensitive=False, executor=_block_executor)
+        finished = False
+        try:
+            while True:
+                part = await read(iterator, None)
+                if part is None:
+                    finished = True
+                    return
+                yield part
+        finally:
+            if not finished:
+                # Stopped (the client went away): Django does not close the response then
+                await sync_to_async(self.close, thread_sensitive=True)()
+
+
+class BlockStreamingResponse(_BlockByBlock, StreamingHttpResponse):
+    """`StreamingHttpResponse` sent block by block on ASGI too."""
+
+
+class BlockFileResponse(_BlockByBlock, FileResponse):
+    """`FileResponse` sent block by block on ASGI too."""
+
+
+def resolve_path(folder, filename):
+    """
+    Path of ``filename`` inside ``folder``, or None if it escapes the folder
+    (``..``, absolute paths, symlinks) or is not a file.
+    """
+    root = os.path.realpath(folder)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+
+def file_etag(stat):
+    """Validator built from the size and modification time of a file."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def _not_modified(request, etag, mtime):
+    """True if the conditional headers of the request say the client copy is current."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``Range: bytes=...`` header.
+
+    Returns:
+        tuple or None: (start, end) inclusive byte positions, None if the header
+        is absent or not a single byte range (the whole file is sent).
+
+    Raises:
+        ValueError: If the range can not be satisfied.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _read_blocks(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _gzip_blocks(path, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            compressed = compressor.compress(block)
+            if compressed:
+                yield compressed
+    yield compressor.flush()
+
+
+def wants_gzip(request, path, requested):
+    """Compress only when asked, accepted by the client and useful for the file type."""
+    accepted = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return bool(requested) and accepted and path.lower().endswith(GZIP_EXTENSIONS)
+
+
+def stream_file(request, path, gzip=False, content_type="application/octet-stream", as_attachment=True):
+    """
+    Response sending ``path`` with conditional, range and gzip support.
+
+    Args:
+        request (HttpRequest): The request (its ``Range``, ``If-Range``,
+            ``If-None-Match``, ``If-Modified-Since`` and ``Accept-Encoding`` headers are used).
+        path (str): The file, already checked with `resolve_path`.
+        gzip (bool): Compress the file on the fly if the client accepts gzip.
+            Ranges are ignored for compressed downloads.
+        content_type (str): Content type of the response.
+        as_attachment (bool): Ask the browser to save the file instead of showing it.
+
+    Returns:
+        HttpResponse: 200, 206, 304 or 416 response.
+    """
+    stat = os.stat(path)
+    compress = wants_gzip(request, path, gzip)
+    etag = file_etag(stat)
+    if compress:
+        etag = etag[:-1] + '-gzip"'
+    validators = {'ETag': etag, 'Last-Modified': http_date(stat.st_mtime), 'Accept-Ranges': 'none' if compress else 'bytes'}
+    filename = os.path.basename(path)
+    disposition = f'{"attachment" if as_attachment else "inline"}; filename="{filename}"'
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponse(status=304)
+    elif compress:
+        response = BlockStreamingResponse(_gzip_blocks(path, GZIP_LEVEL), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Disposition'] = disposition
+        response['Vary'] = 'Accept-Encoding'
+    else:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range.strip() == etag or parse_http_date_safe(if_range) == int(stat.st_mtime):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        if byte_range is None:
+            response = BlockFileResponse(open(path, 'rb'), content_type=content_type, as_attachment=as_attachment, filename=filename)
+        else:
+            start, end = byte_range
+            response = BlockStreamingResponse(_read_blocks(path, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Disposition'] = disposition
+
+    for header, value in validators.items():
+        response[header] = value
+    return response
+
+
+class _ArchiveBuffer:
+    """
+    Write-only stream collecting what an archive writer produces, drained by
+    the response generator after every block. Optionally gzips the data.
+    """
+
+    def __init__(self, gzip_level=None):
+        self._chunks = []
+        self._compressor = None
+        if gzip_level is not None:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._compressor is not None:
+            self._chunks.append(self._compressor.flush())
+            self._compressor = None
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_blocks(files, level):
+    buffer = _ArchiveBuffer()
+    compression = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+    # zipfile writes data descriptors itself, as the buffer can not seek
+    with zipfile.ZipFile(buffer, 'w', compression=compression, compresslevel=level or None) as archive:
+        for arcname, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = compression
+            # ZipFile.open ignores the compresslevel of the archive for a given ZipInfo, so it is
+            # set on the entry: compress_level from Python 3.13, the private slot from 3.7 to 3.12
+            if hasattr(info, 'compress_level'):
+                info.compress_level = level or None
+            else:
+                info._compresslevel = level or None
+            with open(path, 'rb') as f, archive.open(info, 'w', force_zip64=True) as entry:
+                while True:
+                    block = f.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    entry.write(block)
+                    yield buffer.drain()
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def _tar_blocks(files, level):
+    # None writes a plain tar, 0 a gzip stream without compression
+    buffer = _ArchiveBuffer(gzip_level=level)
+    for arcname, path in files:
+        stat = os.stat(path)
+        info = tarfile.TarInfo(arcname)
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        buffer.write(info.tobuf(tarfile.PAX_FORMAT))
+        for block in _read_blocks(path, 0, stat.st_size):
+            buffer.write(block)
+            yield buffer.drain()
+        # Members are padded to whole tar blocks
+        buffer.write(b'\0' * (-stat.st_size % tarfile.BLOCKSIZE))
+    # End of archive: two empty blocks, padded to a whole record
+    buffer.write(b'\0' * tarfile.RECORDSIZE)
+    buffer.close()
+    yield buffer.drain()
+
+
+ARCHIVE_FORMATS = {
+    'zip': (_zip_blocks, 'application/zip', 'zip'),
+    'tar': (_tar_blocks, 'application/x-tar', 'tar'),
+    'tar.gz': (_tar_blocks, 'application/gzip', 'tar.gz'),
+}
+
+
+def stream_archive(files, name, archive_format='zip', level=6):
+    """
+    Response sending several files as one archive, built while it is sent.
+
+    Only one block of each file is in memory at a time and nothing is written
+    to disk.
+
+    Args:
+        files (list of tuple): (name inside the archive, path) of the files,
+            already checked with `resolve_path`.
+        name (str): Name of the archive, without extension.
+        archive_format (str): 'zip', 'tar' or 'tar.gz'.
+        level (int): Compression level, 0 (stored) to 9. Ignored for 'tar'.
+
+    Returns:
+        BlockStreamingResponse
+    """
+    blocks, content_type, extension = ARCHIVE_FORMATS[archive_format]
+    if archive_format == 'tar':
+        level = None
+
+    response = BlockStreamingResponse((block for block in blocks(files, level) if block), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
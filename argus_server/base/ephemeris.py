@@ -0,0 +1,230 @@
+"""
+Lazy loading of the skyfield ephemeris and timescale.
+
+Nothing is loaded when this module is imported. The ephemeris is opened the
+first time a planet position is needed and then shared by every thread of the
+process. The BSP file is opened from the local path configured in config.ini
+(``ephemeris_file``), and jplephem memory-maps it, so every worker process
+shares the same pages from the OS cache instead of keeping its own copy. The
+timescale uses the leap second and Delta T tables shipped with skyfield, so no
+download is attempted.
+
+Planet positions for the current nights are also kept in a `PlanetTable`,
+sampled every few minutes and rebuilt once a day by a background thread, so
+most requests only need a cubic interpolation instead of a full skyfield
+computation.
+"""
+
+from datetime import datetime, timedelta
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from django.conf import settings
+
+# Display name -> name of the body in the ephemeris file
+BODIES = {
+    "Mercury": 'mercury',
+    "Venus": 'venus',
+    "Moon": 'moon',
+    "Mars": 'mars',
+    "Jupiter": 'jupiter barycenter',
+    "Saturn": 'saturn barycenter',
+    "Uranus": 'uranus barycenter',
+    "Neptune": 'neptune barycenter'
+}
+
+_lock = threading.Lock()
+_planets = None
+_timescale = None
+
+
+def get_timescale():
+    """Returns the skyfield timescale, built from the data bundled with skyfield."""
+    global _timescale
+    if _timescale is None:
+        with _lock:
+            if _timescale is None:
+                from skyfield.api import load
+                _timescale = load.timescale(builtin=True)
+    return _timescale
+
+
+def get_planets():
+    """
+    Returns the ephemeris (JPL DE421 by default), loading it on first use.
+
+    The file is read from ``settings.EPHEMERIS_FILE``. If it does not exist,
+    skyfield tries to download it into that path.
+    """
+    global _planets
+    if _planets is None:
+        with _lock:
+            if _planets is None:
+                from skyfield.api import Loader, load_file
+
+                path = settings.EPHEMERIS_FILE
+                if os.path.exists(path):
+                    _planets = load_file(path)
+                else:
+                    print(f"Ephemeris file {path} not found, downloading it.")
+                    directory, filename = os.path.split(os.path.abspath(path))
+                    _planets = Loader(directory, verbose=False)(filename)
+    return _planets
+
+
+def get_body(body_name):
+    """
+    Returns the ephemeris segment of a body.
+
+    Args:
+        body_name (str): One of the keys of `BODIES` (e.g. "Mars").
+    """
+    return get_planets()[BODIES[body_name]]
+
+
+def get_observer():
+    """Returns the observer position used for planet coordinates (Earth's center)."""
+    return get_planets()['earth']
+
+
+def _julian_date(dt):
+    """Julian date of a naive UTC datetime."""
+    return (dt - datetime(1970, 1, 1)).total_seconds() / 86400.0 + 2440587.5
+
+
+class PlanetTable:
+    """
+    RA/Dec of every body in `BODIES` sampled on a regular UTC time grid.
+
+    Positions are the same astrometric coordinates returned by
+    `base.auxiliares.get_body_coords`, kept in a single (bodies, samples, 2)
+    float array and evaluated with a 4-point (cubic) Lagrange interpolation,
+    which stays well below one arcsecond for a 10 minute step, even for the Moon.
+
+    Parameters
+    ----------
+    start : datetime.datetime
+        Naive UTC datetime of the first sample.
+    hours : float
+        Time span covered by the table.
+    step_minutes : float
+        Minutes between samples.
+    """
+
+    def __init__(self, start, hours, step_minutes):
+        self.start = start
+        self.step_minutes = float(step_minutes)
+        self.n_samples = int(np.ceil(hours * 60.0 / self.step_minutes)) + 1
+        self.start_jd = _julian_date(start)
+        self.step_days = self.step_minutes / 1440.0
+        self.end_jd = self.start_jd + (self.n_samples - 1) * self.step_days
+
+        minutes = start.minute + self.step_minutes * np.arange(self.n_samples)
+        times = get_timescale().utc(start.year, start.month, start.day, start.hour, minutes, start.second)
+
+        observer = get_observer()
+        self.index = {}
+        self.coords = np.empty((len(BODIES), self.n_samples, 2))
+        for i, body_name in enumerate(BODIES):
+            ra, dec, _ = observer.at(times).observe(get_body(body_name)).radec()
+            self.index[body_name] = i
+            # Unwrap RA so the interpolation does not jump at 0h
+            self.coords[i, :, 0] = np.rad2deg(np.unwrap(ra.radians))
+            self.coords[i, :, 1] = dec.degrees
+
+    def covers(self, jd):
+        """True if every Julian date in ``jd`` can be interpolated by this table."""
+        first, last = self.start_jd + self.step_days, self.end_jd - self.step_days
+        if np.ndim(jd) == 0:
+            return first <= jd <= last
+        jd = np.asarray(jd, dtype=float)
+        return bool(np.all((jd >= first) & (jd <= last)))
+
+    @staticmethod
+    def _weights(u):
+        """Lagrange weights of the samples i-1, i, i+1, i+2 for the offset ``u`` from sample i."""
+        return (
+            -u * (u - 1) * (u - 2) / 6.0,
+            (u + 1) * (u - 1) * (u - 2) / 2.0,
+            -(u + 1) * u * (u - 2) / 2.0,
+            (u + 1) * u * (u - 1) / 6.0,
+        )
+
+    def interpolate(self, body_name, jd):
+        """
+        Interpolate the RA and Dec of a body.
+
+        Args:
+            body_name (str): One of the keys of `BODIES`.
+            jd (float or numpy.ndarray): UTC Julian date(s), inside the table (see `covers`).
+
+        Returns:
+            tuple: RA and Dec in degrees (floats or arrays, following ``jd``).
+        """
+        samples = self.coords[self.index[body_name]]
+
+        if np.ndim(jd) == 0:
+            x = (float(jd) - self.start_jd) / self.step_days
+            i = min(max(int(math.floor(x)), 1), self.n_samples - 3)
+            ra, dec = np.dot(self._weights(x - i), samples[i - 1:i + 3])
+            return float(ra) % 360.0, float(dec)
+
+        x = (np.asarray(jd, dtype=float) - self.start_jd) / self.step_days
+        i = np.clip(np.floor(x).astype(int), 1, self.n_samples - 3)
+        weights = self._weights(x - i)
+        ra = sum(w * samples[i + k - 1, 0] for k, w in enumerate(weights))
+        dec = sum(w * samples[i + k - 1, 1] for k, w in enumerate(weights))
+        return np.mod(ra, 360.0), dec
+
+
+_table = None
+_table_thread = None
+
+
+def build_planet_table(now=None):
+    """
+    Build the planet table for the current nights and make it the active one.
+
+    The table starts 12 hours before the current UTC day and covers three days,
+    so it always contains the whole coming night plus the one before.
+    """
+    global _table
+    if now is None:
+        now = datetime.utcnow()
+    start = datetime(now.year, now.month, now.day) - timedelta(hours=12)
+    _table = PlanetTable(start, hours=72, step_minutes=settings.EPHEMERIS_TABLE_STEP)
+    return _table
+
+
+def _rebuild_planet_table_daily():
+    while True:
+        try:
+            build_planet_table()
+        except Exception as e:
+            print(f"Could not build the planet table: {e}")
+            time.sleep(60)
+            continue
+
+        # Sleep until a few minutes after the next UTC midnight
+        now = datetime.utcnow()
+        tomorrow = datetime(now.year, now.month, now.day) + timedelta(days=1, minutes=5)
+        time.sleep((tomorrow - now).total_seconds())
+
+
+def get_planet_table():
+    """
+    Returns the active planet table, or None while the first one is being built.
+
+    The first call starts the background thread that rebuilds the table every day.
+    """
+    global _table_thread
+    if _table_thread is None:
+        with _lock:
+            if _table_thread is None:
+                _table_thread = threading.Thread(target=_rebuild_planet_table_daily, daemon=True)
+                _table_thread.start()
+    return _table
@@ -6,8 +6,19 @@ SetFilter
 SetFrameMode
 """
 
+from datetime import datetime
+import hashlib
+from itertools import permutations
+import json
+import math
 import os
+
+import pytz
+
+from base import handoff
+from base.auxiliares import get_body_coords
 from base.models import ObservationPlan
+from base.telescopestate import telescope_state
 from django.conf import settings
 
 def convert_coordinates(ra_deg, dec_deg):
@@ -51,6 +62,190 @@ def convert_coordinates(ra_deg, dec_deg):
 
     return formatted, simplified
 
+# Filters in the order they sit in the filter wheel
+FILTER_WHEEL = [filtro.strip() for filtro in settings.FILTROS]
+FRAME_MODES = [mode.strip() for mode in settings.TIPOS_FRAME]
+
+# Version of the document layout stored in ObservationPlan.instructions, bump it
+# when build_steps or format_instructions change
+INSTRUCTIONS_VERSION = 1
+
+# Fraction of TEMPO_DESLIZE kept as settle time after a very short slew
+MIN_SETTLE_FRACTION = 0.25
+
+# Padding used by orchestrate documents after the argument of each command
+_PADDING = {'SlewToObject': 7}
+
+
+def _wheel_moves(filter_a, filter_b):
+    """Number of positions the wheel turns between two filters (1 if a filter is unknown)."""
+    if filter_a == filter_b:
+        return 0
+    if filter_a not in FILTER_WHEEL or filter_b not in FILTER_WHEEL:
+        return 1
+    distance = abs(FILTER_WHEEL.index(filter_a) - FILTER_WHEEL.index(filter_b))
+    return min(distance, len(FILTER_WHEEL) - distance)
+
+
+def order_filters(filters, current_filter=None):
+    """
+    Order the filters of a plan so the filter wheel moves as little as possible.
+
+    Parameters
+    ----------
+    filters : list of str
+        Filters in the order the user typed them. Repeated filters are kept together.
+    current_filter : str, optional
+        Filter in place before the plan starts.
+
+    Returns
+    -------
+    list of str
+    """
+    distinct = list(dict.fromkeys(filters))
+    if len(distinct) > 7:
+        orders = [sorted(distinct, key=lambda f: FILTER_WHEEL.index(f) if f in FILTER_WHEEL else len(FILTER_WHEEL))]
+    else:
+        orders = permutations(distinct)
+
+    def moves(order):
+        total, previous = 0, current_filter
+        for filtro in order:
+            if previous is not None:
+                total += _wheel_moves(previous, filtro)
+            previous = filtro
+        return total
+
+    best = min(orders, key=moves)
+    return [filtro for filtro in best for _ in range(filters.count(filtro))]
+
+
+def settle_time(distance):
+    """
+    Seconds to wait after a slew of ``distance`` degrees (None if unknown).
+
+    Slews longer than settings.DISTANCIA_DESLIZE_COMPLETO wait the full
+    TEMPO_DESLIZE, shorter ones wait proportionally less.
+    """
+    if distance is None:
+        return settings.TEMPO_DESLIZE
+    fraction = min(max(distance / settings.DISTANCIA_DESLIZE_COMPLETO, MIN_SETTLE_FRACTION), 1.0)
+    return round(settings.TEMPO_DESLIZE * fraction, 1)
+
+
+def _angular_distance(ra1, dec1, ra2, dec2):
+    ra1, dec1, ra2, dec2 = map(math.radians, (ra1, dec1, ra2, dec2))
+    cos_distance = math.sin(dec1) * math.sin(dec2) + math.cos(dec1) * math.cos(dec2) * math.cos(ra1 - ra2)
+    return math.degrees(math.acos(min(max(cos_distance, -1.0), 1.0)))
+
+
+def _plan_target(plan):
+    """Current RA/Dec of the plan target, in degrees."""
+    if plan.object_name:
+        return get_body_coords(plan.object_name, pytz.utc.localize(datetime.utcnow()))
+    return plan.ra, plan.dec
+
+
+def build_steps(plans, position=None, frame_mode=None, current_filter=None):
+    """
+    Build the optimized list of orchestrate steps for one or more plans.
+
+    Plans are visited nearest first, filters are reordered to minimize wheel
+    movements, ``SetFrameMode``/``SetFilter`` are dropped when the state does not
+    change and the settle wait after each slew is scaled by the slew distance.
+
+    Parameters
+    ----------
+    plans : list of ObservationPlan
+        Plans to put in the same document. The first one is always executed first.
+    position : tuple, optional
+        (ra, dec) in degrees where the telescope points before the document.
+    frame_mode : str, optional
+        Frame mode set before the document.
+    current_filter : str, optional
+        Filter in place before the document.
+
+    Returns
+    -------
+    steps : list of tuple
+        (command, argument) pairs.
+    manifest : list of int
+        The plan id of each ``TakeImage`` step, in order.
+    """
+    targets = {plan.id: _plan_target(plan) for plan in plans}
+
+    # Nearest neighbour order, starting with the first plan
+    remaining = list(plans[1:])
+    ordered = [plans[0]]
+    while remaining:
+        last = targets[ordered[-1].id]
+        nearest = min(remaining, key=lambda plan: _angular_distance(*last, *targets[plan.id]))
+        remaining.remove(nearest)
+        ordered.append(nearest)
+
+    steps = []
+    manifest = []
+    for plan in ordered:
+        target = targets[plan.id]
+        distance = _angular_distance(*position, *target) if position is not None else None
+
+        if distance is None or distance > 1e-6:
+            if plan.object_name:
+                steps.append(('SlewToObject', plan.object_name))
+            else:
+                coordinates = convert_coordinates(plan.ra, plan.dec)
+                steps.append(('SlewToRaDec', coordinates[1]))
+        position = target
+
+        if plan.framemode.strip() != frame_mode:
+            frame_mode = plan.framemode.strip()
+            steps.append(('SetFrameMode', frame_mode))
+
+        if distance is None or distance > 1e-6:
+            steps.append(('WaitFor', settle_time(distance)))
+
+        filtros = [filtro.strip() for filtro in plan.filters.split(',')]
+        for filtro in order_filters(filtros, current_filter):
+            if filtro != current_filter:
+                current_filter = filtro
+                steps.append(('SetFilter', filtro))
+                steps.append(('WaitFor', settings.TEMPO_FILTRO))
+            steps.append(('TakeImage', plan.exptime))
+            manifest.append(plan.id)
+
+    steps.append(('WaitFor', settings.TEMPO_FRAME))
+    return steps, manifest
+
+
+def format_instructions(steps):
+    """Write a list of (command, argument) steps as an orchestrate document."""
+    return "".join(
+        f"{command:<14}, {argument}{' ' * _PADDING.get(command, 9)},\n"
+        for command, argument in steps
+    )
+
+
+def create_instructions_from_plans(plans, **state):
+    """
+    Generate one orchestrate document executing several plans.
+
+    Parameters
+    ----------
+    plans : list of ObservationPlan
+        The plans, the first one is executed first. Keyword arguments are passed
+        to `build_steps` (``position``, ``frame_mode``, ``current_filter``).
+
+    Returns
+    -------
+    instructions : str
+        The orchestrate document.
+    manifest : list of int
+        The plan id of each ``TakeImage`` in the document, used to split the outputs.
+    """
+    steps, manifest = build_steps(list(plans), **state)
+    return format_instructions(steps), manifest
+
+
 def create_instructions_from_plan(plan_id):
     """
     Generate a set of instructions to execute an observation plan.
@@ -69,53 +264,179 @@ def create_instructions_from_plan(plan_id):
     -----
     This function generates a set of instructions to execute an observation plan.
     The instructions are returned as a string and can be written to a file or sent
-    directly to the telescope control software.
+    directly to the telescope control software. Filters are reordered to minimize
+    the filter wheel movements (see `build_steps`).
 
     Examples
     --------
     >>> instructions = create_instructions_from_plan(42)
     >>> print(instructions)
-    SlewToRaDec   , 42.123456         ,
-    SetFrameMode  , 1         ,
-    WaitFor       , 10         ,
-    SetFilter     , R         ,
-    WaitFor       , 5         ,
-    TakeImage     , 30         ,
-    SetFilter     , G         ,
-    WaitFor       , 5         ,
-    TakeImage     , 30         ,
+    SlewToRaDec   , 2.80823h +22.01450d         ,
+    SetFrameMode  , Light         ,
+    WaitFor       , 1.0         ,
+    SetFilter     , V         ,
+    WaitFor       , 2.0         ,
+    TakeImage     , 30.0         ,
     SetFilter     , B         ,
-    WaitFor       , 5         ,
-    TakeImage     , 30         ,
-    WaitFor       , 10         ,
+    WaitFor       , 2.0         ,
+    TakeImage     , 30.0         ,
+    SetFilter     , R         ,
+    WaitFor       , 2.0         ,
+    TakeImage     , 30.0         ,
+    WaitFor       , 2.0         ,
     """
     
     # Get the plan
     plan = ObservationPlan.objects.filter(id=plan_id).first()
-    instructions = ""
-    
-    if plan.object_name:
-        instructions += f"SlewToObject  , {plan.object_name}       ,\n"
-    else:
-        coordinates = convert_coordinates(plan.ra, plan.dec)
-        instructions += f"SlewToRaDec   , {coordinates[1]}         ,\n"
-        
-    frame_mode = plan.framemode.strip()
-    instructions += f"SetFrameMode  , {frame_mode}         ,\n"
-    
-    instructions += f"WaitFor       , {settings.TEMPO_DESLIZE}         ,\n"
-                     
-    exptime = plan.exptime
-    filtros = plan.filters.split(',')
-    for filtro in filtros:
-        instructions += f"SetFilter     , {filtro.strip()}         ,\n"
-        instructions += f"WaitFor       , {settings.TEMPO_FILTRO}         ,\n"
-        instructions += f"TakeImage     , {exptime}         ,\n"
-    
-    instructions += f"WaitFor       , {settings.TEMPO_FRAME}         ,\n"
-    
+    instructions, _ = create_instructions_from_plans([plan])
     return instructions
 
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+def instructions_key(plan):
+    """
+    Hash of everything the document of a single plan depends on: the plan fields,
+    the settings used by `build_steps` and `INSTRUCTIONS_VERSION`. A stored
+    document is valid while its key matches.
+    """
+    values = (
+        INSTRUCTIONS_VERSION, plan.object_name, _as_float(plan.ra), _as_float(plan.dec), plan.filters, plan.framemode, float(plan.exptime),
+        FILTER_WHEEL, settings.TEMPO_DESLIZE, settings.TEMPO_FILTRO, settings.TEMPO_FRAME,
+    )
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def validate_plan(plan):
+    """
+    Check that orchestrate can execute a plan.
+
+    Raises
+    ------
+    ValueError
+        With a message for the user, if a filter or the frame mode is unknown,
+        the exposure time is out of range or the plan has no target.
+    """
+    unknown = [filtro.strip() for filtro in plan.filters.split(',') if filtro.strip() not in FILTER_WHEEL]
+    if unknown:
+        raise ValueError(f"Filtro desconhecido: {', '.join(unknown)}.")
+    if plan.framemode.strip() not in FRAME_MODES:
+        raise ValueError(f"Frame mode desconhecido: {plan.framemode}.")
+    if not 0 < float(plan.exptime) <= settings.TEMPO_EXPOSICAO_MAXIMO:
+        raise ValueError("Tempo de exposição inválido.")
+    if not plan.object_name and (plan.ra is None or plan.dec is None):
+        raise ValueError("Plano sem coordenadas.")
+
+
+def compile_plan(plan, save=True):
+    """
+    Validate a plan and store its orchestrate document in ``plan.instructions``.
+
+    Parameters
+    ----------
+    plan : ObservationPlan
+        The plan.
+    save : bool, optional
+        Save the document to the database (the plan must already be saved).
+
+    Returns
+    -------
+    str
+        The orchestrate document.
+
+    Raises
+    ------
+    ValueError
+        If the plan can not be executed (see `validate_plan`).
+    """
+    validate_plan(plan)
+    # A plan created in this request may still hold the exposure time as it was sent
+    plan.exptime = float(plan.exptime)
+    plan.instructions, _ = create_instructions_from_plans([plan])
+    plan.instructions_key = instructions_key(plan)
+    if save:
+        ObservationPlan.objects.filter(id=plan.id).update(instructions=plan.instructions, instructions_key=plan.instructions_key)
+    return plan.instructions
+
+
+def compiled_instructions(plan):
+    """The stored document of a plan, compiled again if the plan or the settings changed."""
+    if plan.instructions and plan.instructions_key == instructions_key(plan):
+        return plan.instructions
+    return compile_plan(plan)
+
+
+def parse_instructions(instructions):
+    """
+    Parse an orchestrate document back into (command, argument) steps.
+    """
+    steps = []
+    for line in instructions.splitlines():
+        if not line.strip():
+            continue
+        command, _, argument = line.partition(',')
+        steps.append((command.strip(), argument.rstrip().rstrip(',').strip()))
+    return steps
+
+
+def _parse_raDec(argument):
+    """'12.50000h +30.75000d' -> (187.5, 30.75)"""
+    ra, dec = argument.split()
+    return float(ra.rstrip('h')) * 15.0, float(dec.rstrip('d'))
+
+
+def estimate_step_durations(instructions, position=None, current_filter=None):
+    """
+    Predicted wall-clock seconds of each step of an orchestrate document.
+
+    The cost model uses the slew speed (settings.SLEW_RATE), one filter change
+    time per wheel position (settings.TEMPO_TROCA_FILTRO), the exposure time plus
+    the CCD readout/download (settings.TEMPO_LEITURA_IMAGEM) and the explicit
+    ``WaitFor`` values. A slew from an unknown position is assumed to be 90 degrees.
+
+    Parameters
+    ----------
+    instructions : str
+        The orchestrate document.
+    position : tuple, optional
+        (ra, dec) in degrees where the telescope points before the document.
+    current_filter : str, optional
+        Filter in place before the document.
+
+    Returns
+    -------
+    list of tuple
+        (command, argument, seconds) for every step.
+    """
+    durations = []
+    for command, argument in parse_instructions(instructions):
+        seconds = 0.0
+        if command == 'SlewToRaDec':
+            target = _parse_raDec(argument)
+            distance = _angular_distance(*position, *target) if position is not None else 90.0
+            seconds = distance / settings.SLEW_RATE
+            position = target
+        elif command == 'SlewToObject':
+            seconds = 90.0 / settings.SLEW_RATE
+            position = None
+        elif command == 'SetFilter':
+            moves = _wheel_moves(current_filter, argument) if current_filter is not None else 1
+            seconds = moves * settings.TEMPO_TROCA_FILTRO
+            current_filter = argument
+        elif command == 'WaitFor':
+            seconds = float(argument)
+        elif command == 'TakeImage':
+            seconds = float(argument) + settings.TEMPO_LEITURA_IMAGEM
+        durations.append((command, argument, seconds))
+    return durations
+
+
+def estimate_duration(instructions, **state):
+    """Predicted wall-clock seconds of a whole orchestrate document (see `estimate_step_durations`)."""
+    return sum(seconds for _, _, seconds in estimate_step_durations(instructions, **state))
+
 def get_orchestrate_filename(plan_id):
     """
     Returns the name and path of the orchestration file for a given plan ID.
@@ -129,4 +450,51 @@ def get_orchestrate_filename(plan_id):
     instruction_name = str(plan_id).zfill(8)
     instructions_path = os.path.join(settings.ORCHESTRATE_FOLDER, instruction_name + ".txt")
     
-    return instruction_name, instructions_path
\ No newline at end of file
+    return instruction_name, instructions_path
+
+def start_plan(plan, alt, az, merged=()):
+    """
+    Hand a plan to orchestrate: write its instructions file (atomically and
+    journaled, see `base.handoff`) and mark the telescope as sending. The
+    telescope is taken atomically (idle -> busy) before the file is written, so
+    only one plan can be started at a time.
+
+    Args:
+        plan (ObservationPlan): The plan to execute.
+        alt (float): Altitude of the target, in degrees.
+        az (float): Azimuth of the target, in degrees.
+        merged (list of ObservationPlan, optional): Nearby plans executed in the same document.
+
+    Returns:
+        tuple or None: The instructions written and their manifest (see
+        `create_instructions_from_plans`), or None if the telescope is not idle.
+
+    Raises:
+        ValueError: If the plan can not be executed (see `validate_plan`).
+    """
+    # Compiled before the telescope is taken, so it stays busy only while the file is written
+    if merged:
+        for other in (plan, *merged):
+            validate_plan(other)
+        instructions, manifest = create_instructions_from_plans([plan, *merged])
+    else:
+        instructions = compiled_instructions(plan)
+        manifest = [plan.id for command, _ in parse_instructions(instructions) if command == 'TakeImage']
+
+    if not telescope_state.compare_and_set('idle', status='busy'):
+        return None
+
+    executing_plans = json.dumps({'plans': [plan.id, *[p.id for p in merged]], 'images': manifest}) if merged else None
+    register = dict(status='Sending Instructions', operation=instructions, alt=alt, az=az, ra=plan.ra, dec=plan.dec, executing_plan_id=plan.id, executing_plan_name=plan.name, executing_plans=executing_plans)
+
+    _, instructions_path = get_orchestrate_filename(plan.id)
+    name = os.path.basename(instructions_path)
+    try:
+        handoff.hand_off(name, instructions, register)
+    except Exception:
+        handoff.abort(name)
+        telescope_state.compare_and_set('busy', status='idle')
+        raise
+
+    telescope_state.update(**register)
+    return instructions, manifest
@@ -0,0 +1,148 @@
+"""
+Crash-safe hand-off of the documents to orchestrate.
+
+A document is first written and fsynced under a temporary name in the
+hand-off folder (``handoff_folder``, by default ``argus_handoff`` next to the
+orchestrate folder), then recorded in the journal of that folder, and only then
+renamed into the orchestrate folder. The hand-off folder is outside the
+orchestrate folder, so orchestrate and the watcher never see these files, and
+on the same volume, so the rename is atomic and orchestrate and
+`base.backgroundtask` never see a half-written document.
+
+The journal keeps the telescope register of every document handed off and not
+finished yet (`complete` removes it). After a restart `recover` replays it: a
+document whose rename did not happen is renamed now, and the register of the
+outstanding document is restored, so a plan is never lost or sent twice.
+Temporary files without a journal entry were never handed off and are removed.
+"""
+
+from datetime import datetime
+import json
+import os
+import threading
+
+from django.conf import settings
+
+from base.auxiliares import modificar_data_arquivo
+
+JOURNAL = 'journal.json'
+# Modification time given to the documents, as the old ones are executed first
+DOCUMENT_DATE = datetime(2020, 1, 1, 12, 0)
+
+_lock = threading.Lock()
+
+
+def handoff_folder():
+    return settings.HANDOFF_FOLDER
+
+
+def _temporary_path(name):
+    return os.path.join(handoff_folder(), name + '.tmp')
+
+
+def _fsync_directory(path):
+    """Make a rename durable. Directories can not be opened on Windows, where renames are already durable."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_durably(path, data):
+    with open(path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal():
+    """The outstanding hand-offs: list of {'name', 'telescope'} entries."""
+    try:
+        with open(os.path.join(handoff_folder(), JOURNAL)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _write_journal(entries):
+    path = os.path.join(handoff_folder(), JOURNAL)
+    _write_durably(path + '.tmp', json.dumps(entries))
+    os.replace(path + '.tmp', path)
+    _fsync_directory(handoff_folder())
+
+
+def _publish(name):
+    os.replace(_temporary_path(name), os.path.join(settings.ORCHESTRATE_FOLDER, name))
+    _fsync_directory(settings.ORCHESTRATE_FOLDER)
+
+
+def hand_off(name, instructions, telescope):
+    """
+    Write a document into the orchestrate folder atomically, recording it in the journal.
+
+    Args:
+        name (str): File name of the document in the orchestrate folder.
+        instructions (str): The document.
+        telescope (dict): Telescope register while the document runs, restored by `recover`.
+    """
+    os.makedirs(handoff_folder(), exist_ok=True)
+    temporary = _temporary_path(name)
+    _write_durably(temporary, instructions)
+    modificar_data_arquivo(temporary, DOCUMENT_DATE)
+
+    with _lock:
+        entries = [entry for entry in read_journal() if entry['name'] != name]
+        entries.append({'name': name, 'telescope': telescope})
+        _write_journal(entries)
+    _publish(name)
+
+
+def complete(name=None):
+    """Forget the hand-off of a finished document (every hand-off when ``name`` is None)."""
+    with _lock:
+        entries = read_journal()
+        remaining = [] if name is None else [entry for entry in entries if entry['name'] != name]
+        if remaining != entries:
+            _write_journal(remaining)
+
+
+def abort(name):
+    """Undo a hand-off that failed before its document reached orchestrate."""
+    try:
+        os.remove(_temporary_path(name))
+    except FileNotFoundError:
+        pass
+    complete(name)
+
+
+def recover():
+    """
+    Replay the journal after a restart.
+
+    Returns:
+        dict or None: The telescope register of the outstanding document, or None
+        if no document is outstanding.
+    """
+    entries = read_journal()
+    names = set()
+    for entry in entries:
+        names.add(entry['name'])
+        if os.path.exists(_temporary_path(entry['name'])):
+            # Stopped between the journal and the rename
+            _publish(entry['name'])
+
+    try:
+        files = os.listdir(handoff_folder())
+    except FileNotFoundError:
+        files = []
+    for file in files:
+        if file.endswith('.tmp') and file[:-len('.tmp')] not in names:
+            os.remove(os.path.join(handoff_folder(), file))
+
+    return entries[-1]['telescope'] if entries else None
@@ -0,0 +1,138 @@
+"""
+Listing of the observation plans (``fetch_plans``, ``fetch_observed``).
+
+The query parameters are optional, without them the whole list is returned as
+before:
+
+- ``fields``: comma separated fields to return (`PLAN_FIELDS`).
+- ``executed``: 'true' or 'false'.
+- ``start_after`` / ``start_before``: start time range, as '%Y-%m-%dT%H:%M'.
+- ``order``: 'asc' (default) or 'desc' start time.
+- ``limit``: page size (at most `MAX_LIMIT`). The cursor of the next page is
+  sent in the ``X-Next-Cursor`` header and passed back as ``cursor``.
+
+Pages are read with keyset pagination on (start_time, id), which follows the
+(user, start_time) index, so a page costs the same however long the history
+is. Lists carry an ``ETag``, an unchanged list is answered with 304.
+"""
+
+import base64
+from datetime import datetime
+import hashlib
+import json
+
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from base.downloads import etag_matches
+
+# Fields of a plan returned by the listings (the compiled instructions are internal)
+PLAN_FIELDS = [
+    'id', 'user_id', 'name', 'object_name', 'ra', 'dec', 'filters', 'framemode', 'exptime',
+    'start_time', 'executed', 'executed_at', 'outputs', 'windows_until',
+]
+MAX_LIMIT = 500
+DATE_FORMAT = '%Y-%m-%dT%H:%M'
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing after ``row`` (a dict with ``start_time`` and ``id``)."""
+    start_time = row['start_time'].isoformat() if row['start_time'] is not None else None
+    return base64.urlsafe_b64encode(json.dumps([start_time, row['id']]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (start_time, id) of the last row of the previous page.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        start_time, plan_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(start_time) if start_time is not None else None), int(plan_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Cursor inválido.") from e
+
+
+def _after(plans, cursor, descending):
+    """Rows after the cursor, in (start_time, id) order (SQLite sorts plans without start time first)."""
+    start_time, plan_id = cursor
+    if not descending:
+        if start_time is None:
+            return plans.filter(Q(start_time__isnull=True, id__gt=plan_id) | Q(start_time__isnull=False))
+        return plans.filter(Q(start_time__gt=start_time) | Q(start_time=start_time, id__gt=plan_id))
+    if start_time is None:
+        return plans.filter(start_time__isnull=True, id__lt=plan_id)
+    return plans.filter(Q(start_time__lt=start_time) | Q(start_time=start_time, id__lt=plan_id) | Q(start_time__isnull=True))
+
+
+def _list_etag(rows):
+    digest = hashlib.sha1(json.dumps(rows, default=str, sort_keys=True).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def list_plans(request, plans):
+    """
+    Response listing ``plans`` according to the query parameters (see the module).
+
+    Args:
+        request (Request): The request.
+        plans (QuerySet): The plans the user can see.
+
+    Returns:
+        Response: The list of plans, 304 if it did not change, or 400 for invalid parameters.
+    """
+    params = request.query_params
+    try:
+        fields = [field.strip() for field in params['fields'].split(',')] if params.get('fields') else PLAN_FIELDS
+        unknown = [field for field in fields if field not in PLAN_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {', '.join(unknown)}.")
+
+        if params.get('executed') is not None:
+            if params['executed'].lower() not in ('true', 'false'):
+                raise ValueError("executed deve ser true ou false.")
+            plans = plans.filter(executed=params['executed'].lower() == 'true')
+        if params.get('start_after'):
+            plans = plans.filter(start_time__gte=datetime.strptime(params['start_after'], DATE_FORMAT))
+        if params.get('start_before'):
+            plans = plans.filter(start_time__lt=datetime.strptime(params['start_before'], DATE_FORMAT))
+
+        if params.get('order', 'asc') not in ('asc', 'desc'):
+            raise ValueError("order deve ser asc ou desc.")
+        descending = params.get('order') == 'desc'
+        limit = min(int(params['limit']), MAX_LIMIT) if params.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError("limit deve ser positivo.")
+        if params.get('cursor'):
+            plans = _after(plans, decode_cursor(params['cursor']), descending)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=400)
+
+    plans = plans.order_by('-start_time', '-id') if descending else plans.order_by('start_time', 'id')
+
+    # The cursor fields are always read, and only returned if asked for
+    columns = list(dict.fromkeys(fields + ['start_time', 'id']))
+    if limit is None:
+        rows = list(plans.values(*columns))
+        next_cursor = None
+    else:
+        rows = list(plans.values(*columns)[:limit + 1])
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+    rows = [{field: row[field] for field in fields} for row in rows]
+
+    etag = _list_etag([rows, next_cursor])
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponse(status=304)
+    else:
+        response = Response(rows)
+        if next_cursor is not None:
+            response['X-Next-Cursor'] = next_cursor
+    response['ETag'] = etag
+    # Cached by the browser, but always revalidated
+    response['Cache-Control'] = 'private, no-cache'
+    return response
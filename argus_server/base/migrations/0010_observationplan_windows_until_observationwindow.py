@@ -0,0 +1,31 @@
+# Generated by Django 4.2.5 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_observationplan_object_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observationplan',
+            name='windows_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.CreateModel(
+            name='ObservationWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='windows', to='base.observationplan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['plan', 'end_time'], name='base_observ_plan_id_8bc94b_idx')],
+            },
+        ),
+    ]
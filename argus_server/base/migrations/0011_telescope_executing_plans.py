@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_observationplan_windows_until_observationwindow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telescope',
+            name='executing_plans',
+            field=models.TextField(null=True),
+        ),
+    ]
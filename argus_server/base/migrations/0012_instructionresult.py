@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_telescope_executing_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstructionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.IntegerField()),
+                ('command', models.CharField(max_length=20)),
+                ('arguments', models.CharField(max_length=100)),
+                ('filename', models.CharField(max_length=255, null=True)),
+                ('message', models.CharField(max_length=255)),
+                ('error_code', models.IntegerField()),
+                ('finished_at', models.DateTimeField()),
+                ('duration', models.FloatField(null=True)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='base.observationplan')),
+            ],
+            options={
+                'ordering': ['plan', 'step'],
+                'indexes': [models.Index(fields=['plan', 'step'], name='base_instru_plan_id_faac39_idx')],
+            },
+        ),
+    ]
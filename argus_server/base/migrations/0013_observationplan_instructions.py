@@ -0,0 +1,23 @@
+# Generated by Django 4.2.5 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_instructionresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='observationplan',
+            name='instructions',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='observationplan',
+            name='instructions_key',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_observationplan_instructions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='observationplan',
+            index=models.Index(fields=['user', 'start_time'], name='base_observ_user_id_3666f0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observationplan',
+            index=models.Index(fields=['user', 'executed'], name='base_observ_user_id_01372e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='observationplan',
+            index=models.Index(fields=['executed', 'start_time'], name='base_observ_execute_0a721e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'start_time', 'end_time'], name='base_reserv_user_id_e57a40_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['start_time', 'end_time'], name='base_reserv_start_t_476b9d_idx'),
+        ),
+    ]
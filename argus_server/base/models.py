@@ -13,6 +13,7 @@ class Telescope(models.Model):
     operation = models.TextField(null = True)
     executing_plan_id = models.BigIntegerField(null = True)
     executing_plan_name = models.CharField(max_length=100, null=True)
+    executing_plans = models.TextField(null = True)
     
 class Reservation(models.Model):
     user = models.ForeignKey(
@@ -22,6 +23,12 @@ class Reservation(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(null = True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_time', 'end_time']), # Reservation of a user now (execute_plan, check_user_reservation)
+            models.Index(fields=['start_time', 'end_time']), # Reservations now (scheduler) or upcoming (get_reservations)
+        ]
+
 class ObservationPlan(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -37,4 +44,51 @@ class ObservationPlan(models.Model):
     start_time = models.DateTimeField(null=True)
     executed = models.BooleanField(default=False)
     executed_at = models.DateTimeField(null = True)
-    outputs = models.TextField(null = True)
\ No newline at end of file
+    outputs = models.TextField(null = True)
+    windows_until = models.DateTimeField(null = True) # ObservationWindow rows are valid until this time
+    instructions = models.TextField(null = True) # Orchestrate document, compiled by base.executeobs.compile_plan
+    instructions_key = models.CharField(max_length=40, null=True) # Hash of the plan and settings it was compiled with
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_time']), # fetch_plans
+            models.Index(fields=['user', 'executed']), # fetch_observed, fetch_plans_visibility
+            models.Index(fields=['executed', 'start_time']), # Pending plans (scheduler, planner)
+        ]
+
+class ObservationWindow(models.Model):
+    """Period when a plan is observable, precomputed by base.planner."""
+    plan = models.ForeignKey(
+        ObservationPlan,
+        on_delete=models.CASCADE,
+        related_name='windows',
+    )
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['plan', 'end_time']),
+        ]
+
+class InstructionResult(models.Model):
+    """Result of one instruction of an orchestrate document, parsed by base.orclog."""
+    plan = models.ForeignKey(
+        ObservationPlan,
+        on_delete=models.CASCADE,
+        related_name='results',
+    )
+    step = models.IntegerField() # Position in the orchestrate document
+    command = models.CharField(max_length=20)
+    arguments = models.CharField(max_length=100)
+    filename = models.CharField(max_length=255, null=True) # Image written by TakeImage
+    message = models.CharField(max_length=255)
+    error_code = models.IntegerField()
+    finished_at = models.DateTimeField() # Clock of the telescope computer
+    duration = models.FloatField(null = True) # Seconds since the previous instruction
+
+    class Meta:
+        ordering = ['plan', 'step']
+        indexes = [
+            models.Index(fields=['plan', 'step']),
+        ]
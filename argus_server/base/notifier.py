@@ -0,0 +1,72 @@
+"""
+Telescope status notifications.
+
+The state of the telescope lives in memory (`base.telescopestate`), so the
+status sent to the clients never needs a database query. The fields changed
+since the last push are accumulated here until `argus_server.socket` sends
+them to the connected clients, so the cost of the status does not depend on
+how many dashboards are open. The progress of the running document
+(`base.progress`) is published the same way.
+"""
+
+import threading
+
+from base.telescopestate import telescope_state
+
+_lock = threading.Lock()
+_pending = {}
+_progress = None
+_progress_changed = False
+
+
+def telescope_snapshot():
+    """
+    Returns the current state of the telescope (the same fields as
+    ``Telescope.objects.values()``).
+    """
+    return telescope_state.get()
+
+
+def _record_diff(diff):
+    with _lock:
+        _pending.update(diff)
+
+
+def pop_telescope_diff():
+    """Returns the fields changed since the last call, and forgets them."""
+    with _lock:
+        diff = dict(_pending)
+        _pending.clear()
+    return diff
+
+
+def publish_progress(progress):
+    """
+    Set the progress of the running document (see `base.progress.PlanProgress.snapshot`),
+    or None when no document is running.
+    """
+    global _progress, _progress_changed
+    with _lock:
+        if progress != _progress:
+            _progress = progress
+            _progress_changed = True
+
+
+def progress_snapshot():
+    """Returns the progress of the running document, or None."""
+    with _lock:
+        return _progress
+
+
+def pop_progress():
+    """
+    Returns (changed, progress): whether the progress changed since the last call,
+    and the current progress.
+    """
+    global _progress_changed
+    with _lock:
+        changed, _progress_changed = _progress_changed, False
+        return changed, _progress
+
+
+telescope_state.subscribe(_record_diff)
@@ -0,0 +1,145 @@
+"""
+Parser of the orchestrate result documents (the ``.ORC`` files written to
+``done/`` and ``done/Errors/``).
+
+Every executed instruction is written on its own line, for example::
+
+    SlewToRaDec    :  22.98289, -29.49722 No error.  Error code = 0 (0x0). 10/19/23 22:03:00
+    TakeImage      :  15.00 SBIG driver: Operating system error.  Error code = 1032 (0x408). 03/23/23 22:36:41
+
+The file starts with a binary header (the first result is on the same line) and
+ends with a binary copy of the original document, both ignored. Files are read
+as latin-1, so the binary parts never fail to decode.
+
+`OrcLogParser` reads the file incrementally, so it can follow a document that
+is still being written.
+"""
+
+from datetime import datetime
+import ntpath
+import re
+
+_RESULT = re.compile(
+    r'(?P<command>[A-Z][A-Za-z]+)\s*:\s*(?P<body>.*?)\s*'
+    r'Error code = (?P<code>-?\d+) \(0x[0-9A-Fa-f]+\)\.\s+'
+    r'(?P<timestamp>\d\d/\d\d/\d\d \d\d:\d\d:\d\d)'
+)
+
+# Number of arguments written before the message, for each command
+_N_ARGUMENTS = {
+    'SlewToRaDec': 2,
+    'SlewToObject': 2,
+    'TakeImage': 1,
+    'WaitFor': 1,
+    'SetFilter': 1,
+    'SetFrameMode': 1,
+}
+
+TIMESTAMP_FORMAT = '%m/%d/%y %H:%M:%S'
+
+
+def parse_result_line(line):
+    """
+    Parse one result line.
+
+    Returns:
+        dict or None: ``command``, ``arguments`` (list of str), ``filename``
+        (image written by ``TakeImage``, or None), ``message``, ``error_code``
+        and ``timestamp`` (naive datetime, local time of the telescope computer),
+        or None if the line is not a result.
+    """
+    match = _RESULT.search(line)
+    if match is None:
+        return None
+
+    command = match['command']
+    tokens = match['body'].split()
+    n_arguments = _N_ARGUMENTS.get(command, 0)
+    arguments = [token.rstrip(',') for token in tokens[:n_arguments]]
+    rest = tokens[n_arguments:]
+
+    filename = None
+    if command == 'TakeImage' and rest and ('\\' in rest[0] or '/' in rest[0] or '.' in rest[0][-5:]):
+        filename = rest.pop(0)
+
+    return {
+        'command': command,
+        'arguments': arguments,
+        'filename': filename,
+        'message': ' '.join(rest),
+        'error_code': int(match['code']),
+        'timestamp': datetime.strptime(match['timestamp'], TIMESTAMP_FORMAT),
+    }
+
+
+class OrcLogParser:
+    """
+    Incremental parser of an orchestrate result document.
+
+    Each call to `poll` reads only what was appended since the previous call
+    and returns the new results. A line is only parsed once it is complete.
+
+    Parameters
+    ----------
+    path : str
+        The result document.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.records = []
+        self._partial = ''
+
+    def poll(self):
+        """
+        Read the new complete lines of the document.
+
+        Returns:
+            list of dict: The new results (see `parse_result_line`), with their
+            ``step`` (index in the document) and ``duration`` (seconds since
+            the previous result, None for the first one).
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        self.offset += len(data)
+
+        lines = (self._partial + data.decode('latin-1')).split('\n')
+        self._partial = lines.pop()
+        return [record for record in map(self._add, lines) if record is not None]
+
+    def finish(self):
+        """Read the rest of a finished document, including a last line without newline."""
+        records = self.poll()
+        line, self._partial = self._partial, ''
+        record = self._add(line)
+        if record is not None:
+            records.append(record)
+        return records
+
+    def _add(self, line):
+        record = parse_result_line(line)
+        if record is None:
+            return None
+        previous = self.records[-1] if self.records else None
+        record['step'] = len(self.records)
+        record['duration'] = (record['timestamp'] - previous['timestamp']).total_seconds() if previous else None
+        self.records.append(record)
+        return record
+
+
+def parse_orc_file(path):
+    """All the results of a finished orchestrate document (see `OrcLogParser`)."""
+    parser = OrcLogParser(path)
+    parser.finish()
+    return parser.records
+
+
+def output_files(records):
+    """Basenames of the images written by the ``TakeImage`` results, in order."""
+    # The paths come from the Windows computer running orchestrate
+    return [ntpath.basename(record['filename']) for record in records if record['filename']]
@@ -0,0 +1,226 @@
+"""
+Nightly observability planner.
+
+For every pending `ObservationPlan` the planner computes, on a fine time grid,
+the periods of the coming night in which the target is inside the telescope
+limits (altitude, azimuth and distance from the zenith) and stores them as
+`ObservationWindow` rows. All plans are evaluated at once with
+`check_coordinates_for_obs_angle`, so the dashboard and `execute_plan` can
+answer "is this plan observable now / when next?" with an indexed query.
+
+Times in the database follow the rest of the app (naive Brasilia time), the
+computations are done in UTC.
+"""
+
+from datetime import datetime, timedelta
+import threading
+import time
+
+import numpy as np
+import pytz
+from django.conf import settings
+from django.db import transaction
+
+from base.auxiliares import check_coordinates_for_obs_angle, get_body_coords, get_body_coords_track
+from base.models import ObservationPlan, ObservationWindow
+
+BRASILIA_TZ = pytz.timezone('America/Sao_Paulo')
+
+
+def _to_local(utc_dt):
+    """Naive UTC datetime -> naive Brasilia datetime (the format stored in the database)."""
+    return pytz.utc.localize(utc_dt).astimezone(BRASILIA_TZ).replace(tzinfo=None)
+
+
+def _to_utc(local_dt):
+    """Naive Brasilia datetime -> naive UTC datetime."""
+    return BRASILIA_TZ.localize(local_dt).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def _next_noon(local_dt):
+    """Next local noon (naive Brasilia) after a naive Brasilia datetime."""
+    noon = local_dt.replace(hour=12, minute=0, second=0, microsecond=0)
+    if local_dt >= noon:
+        noon += timedelta(days=1)
+    return noon
+
+
+def night_end(utcnow):
+    """
+    End of the planning horizon (naive UTC): the local noon that follows the coming night.
+    """
+    return _to_utc(_next_noon(_to_local(utcnow) + timedelta(hours=12)))
+
+
+def compute_windows(plans, start, end, step_minutes=None):
+    """
+    Compute the observable windows of several plans between two UTC times.
+
+    Parameters
+    ----------
+    plans : list of ObservationPlan
+        The plans to evaluate.
+    start, end : datetime.datetime
+        Naive UTC limits of the time grid.
+    step_minutes : float, optional
+        Grid step. Default is settings.PLANNER_STEP.
+
+    Returns
+    -------
+    dict
+        Plan id -> list of (start, end) naive UTC datetimes of the observable periods.
+    """
+    if step_minutes is None:
+        step_minutes = settings.PLANNER_STEP
+
+    n_times = int((end - start).total_seconds() // (step_minutes * 60)) + 1
+    times = np.datetime64(start, 'us') + np.arange(n_times) * np.timedelta64(int(step_minutes * 60e6), 'us')
+
+    # (plans x times) grid of coordinates, planets follow their track
+    ra = np.empty((len(plans), n_times))
+    dec = np.empty((len(plans), n_times))
+    tracks = {}
+    for i, plan in enumerate(plans):
+        if plan.object_name:
+            if plan.object_name not in tracks:
+                tracks[plan.object_name] = get_body_coords_track(plan.object_name, times)
+            ra[i], dec[i] = tracks[plan.object_name]
+        else:
+            ra[i], dec[i] = plan.ra, plan.dec
+
+    allowed, _, _, _ = check_coordinates_for_obs_angle(ra, dec, times)
+
+    # Runs of allowed samples: +1 where a window starts, -1 after it ends
+    padded = np.zeros((len(plans), n_times + 2), dtype=np.int8)
+    padded[:, 1:-1] = allowed
+    edges = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    end_cols = np.nonzero(edges == -1)[1] - 1
+
+    windows = {plan.id: [] for plan in plans}
+    for row, first, last in zip(start_rows, start_cols, end_cols):
+        windows[plans[row].id].append((times[first].astype(datetime), times[last].astype(datetime)))
+    return windows
+
+
+def update_plan_windows(plans=None, utcnow=None):
+    """
+    Recompute and store the observable windows until the end of the coming night.
+
+    Args:
+        plans (list of ObservationPlan, optional): Plans to update. Default is every pending plan.
+        utcnow (datetime, optional): Naive UTC start of the horizon. Default is now.
+
+    Returns:
+        int: The number of windows stored.
+    """
+    if utcnow is None:
+        utcnow = datetime.utcnow()
+    if plans is None:
+        plans = list(ObservationPlan.objects.filter(executed=False))
+    plans = [plan for plan in plans if plan.object_name or (plan.ra is not None and plan.dec is not None)]
+    if not plans:
+        return 0
+
+    start = utcnow.replace(second=0, microsecond=0)
+    end = night_end(utcnow)
+    windows = compute_windows(plans, start, end)
+
+    rows = [
+        ObservationWindow(plan_id=plan_id, start_time=_to_local(first), end_time=_to_local(last))
+        for plan_id, plan_windows in windows.items()
+        for first, last in plan_windows
+    ]
+    plan_ids = [plan.id for plan in plans]
+    with transaction.atomic():
+        ObservationWindow.objects.filter(plan_id__in=plan_ids).delete()
+        ObservationWindow.objects.bulk_create(rows)
+        ObservationPlan.objects.filter(id__in=plan_ids).update(windows_until=_to_local(end))
+    return len(rows)
+
+
+def get_plans_visibility(plans, utcnow=None):
+    """
+    Look up the precomputed windows of several plans with a single query.
+
+    Args:
+        plans (list of ObservationPlan): The plans.
+        utcnow (datetime, optional): Naive UTC time of the question. Default is now.
+
+    Returns:
+        dict: Plan id -> ``{'observable': bool, 'window': (start, end) or None, 'next_window': (start, end) or None}``
+        in Brasilia time, or None for plans whose windows do not cover ``utcnow`` (not planned yet).
+    """
+    if utcnow is None:
+        utcnow = datetime.utcnow()
+    now = _to_local(utcnow)
+
+    visibility = {}
+    planned = []
+    for plan in plans:
+        if plan.windows_until is None or now > plan.windows_until:
+            visibility[plan.id] = None
+        else:
+            visibility[plan.id] = {'observable': False, 'window': None, 'next_window': None}
+            planned.append(plan.id)
+
+    windows = (ObservationWindow.objects
+               .filter(plan_id__in=planned, end_time__gte=now)
+               .order_by('plan_id', 'start_time')
+               .values_list('plan_id', 'start_time', 'end_time'))
+    for plan_id, start_time, end_time in windows:
+        entry = visibility[plan_id]
+        if start_time <= now:
+            entry['observable'] = True
+            entry['window'] = (start_time, end_time)
+        elif entry['next_window'] is None:
+            entry['next_window'] = (start_time, end_time)
+    return visibility
+
+
+def get_plan_visibility(plan, utcnow=None):
+    """Same as `get_plans_visibility` for a single plan."""
+    return get_plans_visibility([plan], utcnow)[plan.id]
+
+
+def check_plan_now(plan, utcnow=None):
+    """
+    Same result as `check_plan_ok(plan, now=True)`, using the precomputed windows.
+
+    Returns:
+        tuple or None: (allowed, distance, altitude, azimuth), or None if the plan
+        has no windows for this time and `check_plan_ok` must be used.
+    """
+    if utcnow is None:
+        utcnow = datetime.utcnow()
+    visibility = get_plan_visibility(plan, utcnow)
+    if visibility is None:
+        return None
+
+    if plan.object_name:
+        ra, dec = get_body_coords(plan.object_name, pytz.utc.localize(utcnow))
+    else:
+        ra, dec = plan.ra, plan.dec
+    _, distance, altitude, azimuth = check_coordinates_for_obs_angle(ra, dec, utcnow)
+    return visibility['observable'], float(distance), float(altitude), float(azimuth)
+
+
+def _plan_nightly():
+    while True:
+        try:
+            stored = update_plan_windows()
+            print(f"Planner: {stored} observation windows until {_to_local(night_end(datetime.utcnow()))}")
+        except Exception as e:
+            print(f"Planner failed: {e}")
+            time.sleep(60)
+            continue
+
+        # Sleep until the next local noon
+        now = datetime.utcnow()
+        time.sleep(max((_to_utc(_next_noon(_to_local(now))) - now).total_seconds(), 60))
+
+
+# Start the background thread when Django starts
+thread = threading.Thread(target=_plan_nightly)
+thread.daemon = True
+thread.start()
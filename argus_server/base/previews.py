@@ -0,0 +1,201 @@
+"""
+Preview thumbnails of the FITS frames.
+
+The image is read through a memory map, reduced by block averaging and
+stretched (zscale or percentiles) with NumPy, then written as an 8 bit
+grayscale PNG (zlib only) or a JPEG (Pillow). Previews are
+kept in a disk cache (``preview_cache_folder``) keyed by the file, its
+modification time and the preview options, and the oldest ones are removed
+when the cache grows over ``preview_cache_size_mb``.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+from astropy.io import fits
+from astropy.visualization import ZScaleInterval
+from django.conf import settings
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow (see requirements.txt) only PNG previews are available
+    Image = None
+
+STRETCHES = ('zscale', 'percentile')
+MAX_SIZE = 1024  # Largest side of a preview, in pixels
+
+_cache_lock = threading.Lock()
+
+
+def preview_formats():
+    """Image formats available for the previews."""
+    return ('png', 'jpg') if Image is not None else ('png',)
+
+
+def _image_hdu(hdul):
+    for hdu in hdul:
+        if hdu.data is not None and hdu.data.ndim >= 2:
+            return hdu
+    raise ValueError("No image found in the file")
+
+
+def downsample(image, size, rows_per_step=4 * 1024 * 1024):
+    """
+    Reduce an image by averaging square blocks, so that its largest side is at most ``size``.
+
+    The image is processed in strips of about ``rows_per_step`` pixels, so a
+    memory-mapped image is never fully loaded or converted to float.
+    """
+    factor = max(int(np.ceil(max(image.shape) / size)), 1)
+    height, width = (image.shape[0] // factor) * factor, (image.shape[1] // factor) * factor
+    mean = np.nanmean if np.issubdtype(image.dtype, np.floating) else np.mean
+
+    block_rows = max(rows_per_step // (width * factor), 1) * factor
+    strips = []
+    for start in range(0, height, block_rows):
+        strip = np.asarray(image[start:min(start + block_rows, height), :width], dtype=np.float32)
+        strips.append(mean(strip.reshape(strip.shape[0] // factor, factor, width // factor, factor), axis=(1, 3)))
+    return np.concatenate(strips)
+
+
+def read_downsampled(path, size):
+    """
+    First image of a FITS file, read through a memory map and reduced with `downsample`.
+
+    The BSCALE/BZERO scaling is applied after the reduction, on the small image.
+    """
+    with fits.open(path, memmap=True, do_not_scale_image_data=True) as hdul:
+        hdu = _image_hdu(hdul)
+        data = hdu.data
+        while data.ndim > 2:
+            data = data[0]
+        image = downsample(data, size)
+        return image * hdu.header.get('BSCALE', 1.0) + hdu.header.get('BZERO', 0.0)
+
+
+def stretch(image, method='zscale', percentiles=(0.5, 99.5), n_samples=10000):
+    """
+    Scale an image to 8 bits.
+
+    Args:
+        image (numpy.ndarray): 2D image.
+        method (str): 'zscale' or 'percentile'.
+        percentiles (tuple): Lower and upper percentiles for the 'percentile' stretch.
+        n_samples (int): Number of pixels used to compute the limits.
+
+    Returns:
+        numpy.ndarray: uint8 image.
+    """
+    finite = image[np.isfinite(image)]
+    if finite.size == 0:
+        return np.zeros(image.shape, dtype=np.uint8)
+    samples = finite[::max(finite.size // n_samples, 1)]
+
+    if method == 'zscale':
+        low, high = ZScaleInterval().get_limits(samples)
+    else:
+        low, high = np.percentile(samples, percentiles)
+    if high <= low:
+        high = low + 1
+
+    scaled = (np.nan_to_num(image, nan=low) - low) * (255.0 / (high - low))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def encode_png(pixels):
+    """Encode a 2D uint8 array as a grayscale PNG."""
+    height, width = pixels.shape
+    # Every row starts with the filter type (0, none)
+    rows = np.zeros((height, width + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b'')
+
+
+def encode_jpeg(pixels, quality=85):
+    """Encode a 2D uint8 array as a JPEG (requires Pillow)."""
+    from io import BytesIO
+    output = BytesIO()
+    Image.fromarray(pixels).save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def render_preview(path, size=256, method='zscale', image_format='png'):
+    """
+    Preview of a FITS file.
+
+    Returns:
+        bytes: The encoded image.
+    """
+    pixels = stretch(read_downsampled(path, size), method)
+    # FITS images start at the bottom row
+    pixels = np.ascontiguousarray(pixels[::-1])
+    if image_format == 'jpg':
+        return encode_jpeg(pixels)
+    return encode_png(pixels)
+
+
+def _trim_cache(folder, max_bytes):
+    """Remove the least recently used previews until the cache fits in ``max_bytes``."""
+    entries = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_atime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def get_preview(path, size=256, method='zscale', image_format='png'):
+    """
+    Path of the cached preview of a FITS file, rendering it if needed.
+
+    Args:
+        path (str): The FITS file, already checked with `base.downloads.resolve_path`.
+        size (int): Largest side of the preview, in pixels (at most `MAX_SIZE`).
+        method (str): One of `STRETCHES`.
+        image_format (str): One of `preview_formats`.
+
+    Returns:
+        str: Path of the preview in the cache folder.
+    """
+    stat = os.stat(path)
+    key = f"{path}:{stat.st_mtime_ns}:{stat.st_size}:{size}:{method}"
+    name = hashlib.sha1(key.encode()).hexdigest() + '.' + image_format
+    folder = settings.PREVIEW_CACHE_FOLDER
+    preview_path = os.path.join(folder, name)
+
+    if os.path.exists(preview_path):
+        # Mark as recently used, the modification time is kept as it is the ETag of the preview
+        os.utime(preview_path, ns=(time.time_ns(), os.stat(preview_path).st_mtime_ns))
+        return preview_path
+
+    data = render_preview(path, size, method, image_format)
+    with _cache_lock:
+        os.makedirs(folder, exist_ok=True)
+        temporary = preview_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, preview_path)
+        _trim_cache(folder, settings.PREVIEW_CACHE_SIZE * 1024 * 1024)
+    return preview_path
@@ -0,0 +1,223 @@
+"""
+Progress of the document being executed by orchestrate.
+
+`PlanProgress` follows a running document with the durations predicted by
+`base.executeobs.estimate_step_durations`, corrected by what orchestrate
+actually writes: each frame of the document saved to the images folder
+completes a ``TakeImage`` step, and the ``.ORC`` result document (read with
+`base.orclog.OrcLogParser`) confirms the steps it lists. The frames of the
+document are the FITS files written after it started with the name prefix of
+its frames (the name without the sequence number, see `image_prefix`):
+``images_prefix`` if set, otherwise the prefix of the first frame named in the
+result document, or any FITS file until then.
+
+The same predictions decide when a document is stalled (`PlanProgress.deadline`):
+every new frame or result is a heartbeat, and the document is stalled when the
+next one is late by more than the predicted duration of the steps before it
+(times ``fator_tempo_operacao``, plus ``margem_tempo_operacao`` seconds).
+"""
+
+import ntpath
+import os
+import re
+import time
+
+from django.conf import settings
+
+from base.executeobs import estimate_step_durations
+from base.orclog import OrcLogParser
+
+FITS_EXTENSIONS = ('.fit', '.fits', '.fts')
+# The modification time of the images folder is only trusted once it is this old (seconds),
+# files created in the same clock tick as a scan would not change it
+FOLDER_MTIME_SETTLE = 2
+
+
+def image_prefix(filename):
+    """Name of a frame without its extension and its trailing sequence number."""
+    stem = os.path.splitext(ntpath.basename(filename))[0]
+    return re.sub(r'[\d_\-.]*$', '', stem)
+
+
+class PlanProgress:
+    """
+    Progress, ETA and stall detection of a running orchestrate document.
+
+    Parameters
+    ----------
+    instructions : str
+        The document sent to orchestrate (``Telescope.operation``).
+    started : float, optional
+        `time.monotonic` time when orchestrate picked up the document.
+    """
+
+    def __init__(self, instructions, started=None):
+        self.steps = estimate_step_durations(instructions or '')
+        now = time.monotonic()
+        self.started = now if started is None else started
+        # Frames written after this (wall-clock) time belong to the document
+        self._started_at = time.time() - (now - self.started)
+        self.parser = None
+        self.n_done = 0
+        self.n_images = 0
+        self.image_prefix = settings.IMAGES_PREFIX or None
+        self._frames = set()  # New FITS files of the images folder, maybe not of this document
+        self._checked = set()  # Files of the images folder already looked at
+        self._folder_mtime = None
+        self.last_error_code = None
+        self.last_activity = self.started  # monotonic time of the last frame or result
+
+    def _advance(self, n_done, now):
+        if n_done > self.n_done:
+            self.n_done = n_done
+            self.last_activity = now
+
+    def follow(self, path, now=None):
+        """
+        Read the new results of the document ``path`` (done/ or done/Errors/).
+
+        Returns:
+            bool: True if new results were read.
+        """
+        now = time.monotonic() if now is None else now
+        if self.parser is None or self.parser.path != path:
+            self.parser = OrcLogParser(path)
+        records = self.parser.poll()
+        if not records:
+            return False
+        self.last_error_code = records[-1]['error_code']
+        if self.image_prefix is None:
+            names = [record['filename'] for record in records if record['command'] == 'TakeImage' and record['filename']]
+            if names:
+                self.image_prefix = image_prefix(names[0])
+        self._advance(len(self.parser.records), now)
+        return True
+
+    def follow_images(self, folder, now=None):
+        """
+        Count the frames of the document written to ``folder``; the n-th frame
+        completes the n-th ``TakeImage`` step.
+
+        Only the files not seen before are looked at, and the folder is not read
+        again while its modification time does not change.
+
+        Returns:
+            bool: True if new frames were found.
+        """
+        now = time.monotonic() if now is None else now
+        try:
+            mtime = os.stat(folder).st_mtime
+            if mtime == self._folder_mtime:
+                return False
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.name in self._checked:
+                        continue
+                    self._checked.add(entry.name)
+                    if entry.name.lower().endswith(FITS_EXTENSIONS) and entry.stat().st_mtime >= self._started_at:
+                        self._frames.add(entry.name)
+        except OSError:
+            return False
+        self._folder_mtime = mtime if time.time() - mtime >= FOLDER_MTIME_SETTLE else None
+
+        if self.image_prefix is None:
+            n_images = len(self._frames)
+        else:
+            n_images = sum(image_prefix(name) == self.image_prefix for name in self._frames)
+        if n_images <= self.n_images:
+            return False
+        self.n_images = n_images
+
+        take_images = [index for index, step in enumerate(self.steps) if step[0] == 'TakeImage']
+        if take_images:
+            self._advance(take_images[min(n_images, len(take_images)) - 1] + 1, now)
+        return True
+
+    def _current(self, now):
+        """Index of the step in progress and the seconds already spent on it."""
+        step = self.n_done
+        spent = max(now - self.last_activity, 0)
+        # Without news from orchestrate, the steps predicted to be over are assumed done
+        while step < len(self.steps) - 1 and spent >= self.steps[step][2]:
+            spent -= self.steps[step][2]
+            step += 1
+        return step, spent
+
+    def next_change(self, now=None):
+        """Seconds until the predicted end of the step in progress (None once the last step is due)."""
+        now = time.monotonic() if now is None else now
+        step, spent = self._current(now)
+        if step >= len(self.steps) - 1:
+            return None
+        return max(self.steps[step][2] - spent, 0)
+
+    def deadline(self):
+        """
+        `time.monotonic` time after which the document is considered stalled: the
+        next heartbeat (the next ``TakeImage``, or the end of the document) is due
+        after the predicted duration of the steps up to it.
+
+        Documents without known steps fall back to ``tempo_maximo_operacao_telescopio``.
+        """
+        if not self.steps:
+            return self.started + settings.OPERATION_TIMEOUT
+        pending = 0.0
+        for command, _, seconds in self.steps[self.n_done:]:
+            pending += seconds
+            if command == 'TakeImage':
+                break
+        return self.last_activity + pending * settings.STALL_FACTOR + settings.STALL_GRACE
+
+    def stalled(self, now=None):
+        """True if orchestrate showed no activity for longer than predicted (see `deadline`)."""
+        now = time.monotonic() if now is None else now
+        return now >= self.deadline()
+
+    def snapshot(self, now=None):
+        """
+        Progress of the document.
+
+        Returns:
+            dict: ``step`` (index of the step in progress), ``n_steps``,
+            ``command`` and ``argument`` of the step, ``done`` (steps confirmed
+            by orchestrate), ``elapsed``, ``expected`` (predicted duration of the
+            whole document) and ``eta`` (predicted seconds left), in seconds.
+        """
+        now = time.monotonic() if now is None else now
+        if not self.steps:
+            return {'step': 0, 'n_steps': 0, 'command': None, 'argument': None, 'done': 0,
+                    'elapsed': round(now - self.started, 1), 'expected': 0, 'eta': 0}
+
+        step, spent = self._current(now)
+        if step >= len(self.steps):
+            # Every step is done, orchestrate is closing the document
+            step, remaining = len(self.steps) - 1, 0
+        else:
+            remaining = max(self.steps[step][2] - spent, 0) + sum(duration for _, _, duration in self.steps[step + 1:])
+        command, argument, _ = self.steps[step]
+        return {
+            'step': step,
+            'n_steps': len(self.steps),
+            'command': command,
+            'argument': argument,
+            'done': self.n_done,
+            'elapsed': round(now - self.started, 1),
+            'expected': round(sum(duration for _, _, duration in self.steps), 1),
+            'eta': round(remaining, 1),
+        }
+
+
+def find_result_document(orchestrate_folder, orc_name):
+    """
+    Path of the result document of ``orc_name`` in done/ or done/Errors/, or None.
+    """
+    done_folder = os.path.join(orchestrate_folder, 'done')
+    for folder in (done_folder, os.path.join(done_folder, 'Errors')):
+        try:
+            files = os.listdir(folder)
+        except OSError:
+            continue
+        for file in files:
+            if orc_name in file and '.ORC' in file:
+                return os.path.join(folder, file)
+    return None
@@ -0,0 +1,201 @@
+"""
+Automatic queue scheduler.
+
+While the telescope is idle, the scheduler picks the next pending
+`ObservationPlan` and hands it to orchestrate through the same path as
+`execute_plan` (`base.executeobs.start_plan`), so `backgroundtask` drives it
+through the usual Sending / executing operations / done states.
+
+A plan is a candidate when:
+
+- it was not executed yet and its ``start_time`` is due (and not older than
+  ``scheduler_grace_minutes``);
+- its user has a `Reservation` covering now. When nobody has a reservation,
+  only plans of staff users are run, as staff can execute at any time;
+- it is observable now (precomputed windows, or `check_plan_ok`).
+
+Among the candidates, the plan with the smallest transition cost from the
+previous one (slew plus filter change, see `transition_cost`) is run first, so
+less time is lost between plans. Other candidates of the same user within
+``scheduler_merge_radius`` degrees of the chosen plan are executed in the same
+orchestrate document (see `base.executeobs.create_instructions_from_plans`),
+which saves the full slew, settle and filter setup of each of them.
+"""
+
+from datetime import datetime, timedelta
+import threading
+import time
+
+import pytz
+from django.conf import settings
+
+from base.astropool import astronomy_pool
+from base.auxiliares import angular_distance_astropy, get_body_coords, utc_to_brasilia
+from base.executeobs import parse_instructions, start_plan
+from base.models import ObservationPlan, Reservation
+from base.planner import check_plan_now
+from base.telescopestate import telescope_state
+
+# State of the telescope after the last plan the scheduler started
+_last = {'ra': None, 'dec': None, 'filter': None}
+
+# Plans already started by the scheduler, they are not retried automatically
+_started = set()
+
+
+def _plan_position(plan):
+    """RA and Dec of the plan target now, in degrees."""
+    if plan.object_name:
+        return get_body_coords(plan.object_name, pytz.utc.localize(datetime.utcnow()))
+    return plan.ra, plan.dec
+
+
+def _first_filter(plan):
+    return plan.filters.split(',')[0].strip()
+
+
+def _last_filter(instructions):
+    """Filter in place at the end of an orchestrate document."""
+    filters = [argument for command, argument in parse_instructions(instructions) if command == 'SetFilter']
+    return filters[-1] if filters else _last['filter']
+
+
+def transition_cost(plan, ra, dec, current_filter):
+    """
+    Estimated seconds lost between the previous plan and ``plan``.
+
+    Args:
+        plan (ObservationPlan): The candidate plan.
+        ra, dec (float): Current pointing in degrees, or None if unknown.
+        current_filter (str): Filter in place, or None if unknown.
+
+    Returns:
+        float: Slew time (distance / settings.SLEW_RATE) plus the settle time
+        (TEMPO_DESLIZE), plus TEMPO_FILTRO if the first filter is different.
+    """
+    cost = settings.TEMPO_DESLIZE
+    if ra is not None:
+        plan_ra, plan_dec = _plan_position(plan)
+        cost += angular_distance_astropy(ra, dec, plan_ra, plan_dec) / settings.SLEW_RATE
+    if current_filter is None or _first_filter(plan) != current_filter:
+        cost += settings.TEMPO_FILTRO
+    return cost
+
+
+def _reserved_users(now):
+    return set(Reservation.objects.filter(start_time__lte=now, end_time__gte=now).values_list('user_id', flat=True))
+
+
+def pick_next_plan(now=None):
+    """
+    Choose the next plan to execute.
+
+    Args:
+        now (datetime, optional): Naive Brasilia time (as stored in the database). Default is now.
+
+    Returns:
+        tuple or None: (plan, alt, az, merged) of the chosen plan, ``merged`` being the
+        nearby plans to execute in the same document, or None if nothing can run now.
+    """
+    if now is None:
+        now = utc_to_brasilia(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')).replace(tzinfo=None)
+
+    plans = (ObservationPlan.objects
+             .filter(executed=False, start_time__lte=now,
+                     start_time__gte=now - timedelta(minutes=settings.SCHEDULER_GRACE))
+             .exclude(id__in=_started)
+             .select_related('user')
+             .order_by('start_time'))
+
+    reserved = _reserved_users(now)
+    eligible = []
+    for plan in plans:
+        if reserved:
+            if plan.user_id not in reserved:
+                continue
+        elif not plan.user.is_staff:
+            continue
+        eligible.append((plan, check_plan_now(plan)))
+
+    # Plans without precomputed windows are checked in one batch of the astronomy pool
+    unknown = [plan for plan, status in eligible if status is None]
+    checked = iter(astronomy_pool.run_batch([('check_plan_ok', (plan, True)) for plan in unknown]))
+
+    candidates = []
+    for plan, status in eligible:
+        if status is None:
+            status = next(checked)
+        allowed, _, alt, az = status
+        if allowed:
+            candidates.append((transition_cost(plan, _last['ra'], _last['dec'], _last['filter']), plan, alt, az))
+
+    if not candidates:
+        return None
+
+    # Cheapest transition first, earliest start time on ties (plans are ordered by start_time)
+    _, plan, alt, az = min(candidates, key=lambda candidate: candidate[0])
+
+    merged = []
+    if settings.SCHEDULER_MERGE_RADIUS > 0:
+        ra, dec = _plan_position(plan)
+        for _, other, _, _ in candidates:
+            if len(merged) + 1 >= settings.SCHEDULER_MERGE_MAX:
+                break
+            if other.id == plan.id or other.user_id != plan.user_id:
+                continue
+            if angular_distance_astropy(ra, dec, *_plan_position(other)) <= settings.SCHEDULER_MERGE_RADIUS:
+                merged.append(other)
+    return plan, alt, az, merged
+
+
+def run_next_plan():
+    """
+    Start the next plan if the telescope is idle.
+
+    Returns:
+        ObservationPlan or None: The plan started.
+    """
+    if telescope_state.get()['status'] != 'idle':
+        return None
+
+    chosen = pick_next_plan()
+    if chosen is None:
+        return None
+    plan, alt, az, merged = chosen
+
+    try:
+        started = start_plan(plan, alt, az, merged)
+    except ValueError as e:
+        # Not executable with the current settings, do not try it again
+        print(f"Scheduler: plan {plan.id} skipped: {e}")
+        _started.update([plan.id, *[other.id for other in merged]])
+        return None
+    if started is None:
+        return None
+    instructions, manifest = started
+
+    _started.update([plan.id, *[other.id for other in merged]])
+    last_plan = next((other for other in merged if other.id == manifest[-1]), plan)
+    ra, dec = _plan_position(last_plan)
+    _last.update(ra=ra, dec=dec, filter=_last_filter(instructions))
+    if merged:
+        print(f"Scheduler: started plan {plan.id} with {[other.id for other in merged]}")
+    else:
+        print(f"Scheduler: started plan {plan.id}")
+    return plan
+
+
+def schedule_queue():
+    while True:
+        try:
+            run_next_plan()
+        except Exception as e:
+            print(f"Scheduler failed: {e}")
+        time.sleep(settings.SCHEDULER_INTERVAL)
+
+
+# Start the background thread when Django starts
+if settings.SCHEDULER_ENABLED:
+    thread = threading.Thread(target=schedule_queue)
+    thread.daemon = True
+    thread.start()
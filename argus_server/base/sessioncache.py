@@ -0,0 +1,124 @@
+"""
+Cache of the authenticated sessions, for the Socket.IO connections.
+
+A connection is authenticated from the session cookie of the browser. Without
+the cache every (re)connection decodes the session and reads the user from the
+database; with it, a reconnection storm (the server restarting with many tabs
+open) costs one lookup per session instead of one per connection.
+
+Entries expire after ``socket_session_cache_seconds`` (or when the session
+expires, if earlier), the least recently used ones are dropped beyond
+``socket_session_cache_size``, and they are removed as soon as the user logs
+out, the session is deleted or the user is deactivated.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.contrib.sessions.models import Session
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http.cookie import parse_cookie
+from django.utils import timezone
+
+
+class SessionCache:
+    """
+    TTL and size bounded LRU cache of session key -> (user id, username).
+
+    Parameters
+    ----------
+    ttl : float
+        Seconds an entry is trusted before the session is read again.
+    max_size : int
+        Maximum number of sessions kept (least recently used are evicted).
+    """
+
+    def __init__(self, ttl=60, max_size=1024):
+        self.ttl = float(ttl)
+        self.max_size = max(int(max_size), 1)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # session key -> (expires, user id, username)
+
+    def _load(self, session_key):
+        """Read the session and its user from the database. Returns (expires, user id, username) or None."""
+        session = Session.objects.filter(session_key=session_key, expire_date__gt=timezone.now()).first()
+        if session is None:
+            return None
+        user_id = session.get_decoded().get('_auth_user_id')
+        if user_id is None:
+            return None
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).values('pk', 'username').first()
+        if user is None:
+            return None
+
+        expires = time.monotonic() + min(self.ttl, (session.expire_date - timezone.now()).total_seconds())
+        return expires, user['pk'], user['username']
+
+    def authenticate(self, session_key):
+        """
+        Returns:
+            tuple or None: (user id, username) of the session, or None if it is
+            not an authenticated session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(session_key)
+                return entry[1], entry[2]
+
+        entry = self._load(session_key)
+        with self._lock:
+            if entry is None:
+                self._entries.pop(session_key, None)
+                return None
+            self._entries[session_key] = entry
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry[1], entry[2]
+
+    def authenticate_cookie(self, cookie):
+        """`authenticate` the session of a ``Cookie`` header (None if it has no session)."""
+        session_key = parse_cookie(cookie or '').get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return None
+        return self.authenticate(session_key)
+
+    def invalidate(self, session_key):
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for session_key in [key for key, entry in self._entries.items() if entry[1] == user_id]:
+                del self._entries[session_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+session_cache = SessionCache(ttl=settings.SOCKET_SESSION_CACHE_TTL, max_size=settings.SOCKET_SESSION_CACHE_SIZE)
+
+
+@receiver(user_logged_out)
+def _logged_out(sender, request, user, **kwargs):
+    if request is not None and request.session.session_key:
+        session_cache.invalidate(request.session.session_key)
+
+
+@receiver(post_delete, sender=Session)
+def _session_deleted(sender, instance, **kwargs):
+    session_cache.invalidate(instance.session_key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def _user_saved(sender, instance, **kwargs):
+    # Deactivated users (or changed usernames) are read again
+    session_cache.invalidate_user(instance.pk)
@@ -0,0 +1,204 @@
+"""
+In-memory state of the telescope.
+
+`telescope_state` is the authoritative copy of the `Telescope` row for this
+process (the server runs a single process). The background task, the views,
+the scheduler and the sockets read it without touching the database, and
+status transitions are atomic compare-and-set operations, so two requests can
+not both start a plan and the background task never overwrites a transition
+made by a request in the meantime.
+
+Changes are written to the database by a single writer thread, merged when
+several happen before a write, and retried when SQLite is locked. The row is
+only read again when it is saved from elsewhere (e.g. the admin).
+"""
+
+from collections import deque
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from base.models import Telescope
+
+# Fields of the register when the telescope is free
+IDLE_STATE = {
+    'ra': 0,
+    'dec': 0,
+    'alt': 0,
+    'az': 0,
+    'status': "idle",
+    'operation': None,
+    'executing_plan_id': None,
+    'executing_plan_name': None,
+    'executing_plans': None,
+}
+
+WRITE_RETRY = 0.5  # Seconds between attempts to write the register when the database is locked
+
+
+class TelescopeState:
+    """
+    Thread-safe copy of the telescope register with asynchronous write-through.
+
+    Parameters
+    ----------
+    name : str
+        Primary key of the `Telescope` row (settings.DB_NAME).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._state = None
+        self._dirty = {}
+        self._writing = False
+        self._listeners = []
+        # Diffs queued in the order of the changes, delivered by one thread at a time
+        self._diffs = deque()
+        self._notifying = False
+        self._writer = None
+
+    def _load(self):
+        state = Telescope.objects.filter(name=self.name).values().first()
+        if state is None:
+            Telescope.objects.create(name=self.name, **IDLE_STATE)
+            state = Telescope.objects.filter(name=self.name).values().first()
+        return state
+
+    def _ensure_loaded(self):
+        if self._state is None:
+            state = self._load()
+            with self._lock:
+                if self._state is None:
+                    self._state = state
+
+    def get(self):
+        """Returns a copy of the state (same keys as ``Telescope.objects.values()``)."""
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._state)
+
+    def get_instance(self):
+        """Returns the state as an unsaved `Telescope` instance, for attribute access."""
+        return Telescope(**self.get())
+
+    def subscribe(self, callback):
+        """Call ``callback(diff)`` with the fields that changed after every change."""
+        self._listeners.append(callback)
+
+    def compare_and_set(self, expected, **fields):
+        """
+        Atomically change the state if the current status is the expected one.
+
+        Args:
+            expected (str, tuple or None): Expected status (or statuses). None always applies the change.
+            **fields: Fields of the register to change.
+
+        Returns:
+            bool: True if the change was applied.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if expected is not None:
+                allowed = (expected,) if isinstance(expected, str) else tuple(expected)
+                if self._state['status'] not in allowed:
+                    return False
+            diff = {key: value for key, value in fields.items() if self._state.get(key) != value}
+            self._state.update(diff)
+            if diff:
+                self._dirty.update(diff)
+                self._start_writer()
+                self._written.notify_all()
+                self._diffs.append(diff)
+
+        self._notify()
+        return True
+
+    def update(self, **fields):
+        """Change the state unconditionally."""
+        self.compare_and_set(None, **fields)
+
+    def reset(self, expected=None):
+        """Return to the idle state (see `compare_and_set` for ``expected``)."""
+        return self.compare_and_set(expected, **IDLE_STATE)
+
+    def reload(self):
+        """Read the register again from the database, dropping the changes not written yet."""
+        state = self._load()
+        with self._lock:
+            previous = self._state or {}
+            self._state = state
+            self._dirty.clear()
+            diff = {key: value for key, value in state.items() if previous.get(key) != value}
+            self._diffs.append(diff)
+        self._notify()
+
+    def _notify(self):
+        """Deliver the queued diffs to the listeners, in order."""
+        with self._lock:
+            if self._notifying:
+                # The thread delivering now (maybe this one, from a listener) sends it next
+                return
+            self._notifying = True
+        while True:
+            with self._lock:
+                if not self._diffs:
+                    self._notifying = False
+                    return
+                diff = self._diffs.popleft()
+            for callback in self._listeners:
+                try:
+                    callback(diff)
+                except Exception as e:
+                    print(f"Telescope state listener failed: {e}")
+
+    def flush(self, timeout=None):
+        """Wait until every change is written to the database. Returns False on timeout."""
+        with self._lock:
+            return self._written.wait_for(lambda: not self._dirty and not self._writing, timeout)
+
+    def _start_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_through, daemon=True)
+            self._writer.start()
+
+    def _write_through(self):
+        while True:
+            with self._lock:
+                self._written.wait_for(lambda: self._dirty)
+                fields, self._dirty = self._dirty, {}
+                self._writing = True
+
+            try:
+                Telescope.objects.filter(name=self.name).update(**fields)
+            except Exception as e:
+                # Any failure (locked database, dropped connection, bad value) is retried,
+                # the writer thread must never die with changes pending
+                print(f"Could not write the telescope register, retrying: {e}")
+                with self._lock:
+                    # Newer changes win over the ones being retried
+                    self._dirty = {**fields, **self._dirty}
+                    self._writing = False
+                    self._written.notify_all()
+                time.sleep(WRITE_RETRY)
+                close_old_connections()
+                continue
+
+            with self._lock:
+                self._writing = False
+                self._written.notify_all()
+
+
+telescope_state = TelescopeState(settings.DB_NAME)
+
+
+@receiver(post_save, sender=Telescope)
+def _telescope_saved(sender, instance, **kwargs):
+    # The writer uses queryset updates, so this is a save made somewhere else (e.g. the admin)
+    if instance.name == settings.DB_NAME:
+        telescope_state.reload()
@@ -1,3 +1,169 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+import io
+import os
+from random import Random
+import tarfile
+import tempfile
+import time
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from base.downloads import stream_archive
+from base.executeobs import format_instructions
+from base.models import ObservationPlan, Reservation
+from base.progress import PlanProgress
+
+
+class QueryCountTests(TestCase):
+    """
+    The number of queries of the endpoints must not grow with the number of
+    plans and reservations.
+    """
+
+    # Session and user, and the session saved again (SESSION_SAVE_EVERY_REQUEST)
+    SESSION_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        Users = get_user_model()
+        cls.staff = Users.objects.create_superuser('staff@argus.test', 'staff', 'password')
+        cls.users = [Users.objects.create_user(f'user{i}@argus.test', f'user{i}', 'password') for i in range(3)]
+
+    def setUp(self):
+        self.client.force_login(self.users[0])
+
+    def add_rows(self, n):
+        start = datetime(2030, 1, 1, 20, 0)
+        for i in range(n):
+            for user in self.users:
+                ObservationPlan.objects.create(
+                    user=user, ra=10.0 * i, dec=-20.0, filters='V, R', framemode='Light', exptime=30,
+                    start_time=start + timedelta(minutes=i), executed=i % 2 == 0,
+                )
+                Reservation.objects.create(user=user, start_time=start + timedelta(days=i), end_time=start + timedelta(days=i, hours=1))
+
+    def assertConstantQueries(self, n_queries, method, url, data=None):
+        for n_rows in (1, 10):
+            self.add_rows(n_rows)
+            with self.assertNumQueries(self.SESSION_QUERIES + n_queries):
+                response = getattr(self.client, method)(url, data or {})
+            self.assertEqual(response.status_code, 200)
+
+    def test_fetch_plans(self):
+        self.assertConstantQueries(1, 'get', '/api/fetch_plans/')
+
+    def test_fetch_observed(self):
+        self.assertConstantQueries(1, 'get', '/api/fetch_observed/')
+
+    def test_check_user_reservation(self):
+        self.assertConstantQueries(1, 'get', '/api/check_user_reservation/')
+
+    def test_get_reservations(self):
+        self.client.force_login(self.staff)
+        self.assertConstantQueries(1, 'get', '/api/get_reservations/')
+
+    def test_execute_plan_without_reservation(self):
+        self.assertConstantQueries(1, 'post', '/api/execute_plan/', {'plan_id': 1})
+
+
+class IndexTests(TestCase):
+    """The hot filters are answered from the composite indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('user@argus.test', 'user', 'password')
+
+    def assertUsesIndex(self, queryset, fields):
+        index = next(index for index in queryset.model._meta.indexes if index.fields == fields)
+        self.assertIn(index.name, queryset.explain())
+
+    def test_fetch_plans_index(self):
+        self.assertUsesIndex(ObservationPlan.objects.filter(user=self.user).order_by('start_time'), ['user', 'start_time'])
+
+    def test_user_reservation_index(self):
+        now = datetime(2030, 1, 1, 20, 0)
+        queryset = Reservation.objects.filter(user=self.user, start_time__lte=now, end_time__gte=now)
+        self.assertUsesIndex(queryset, ['user', 'start_time', 'end_time'])
+
+
+class ArchiveTests(SimpleTestCase):
+    """
+    Compression level of the streamed archives.
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        path = os.path.join(folder.name, 'image.fits')
+        random = Random(0)
+        with open(path, 'wb') as f:
+            # Compressible, but not equally well at every level
+            f.write(bytes(random.choice(b'abcdefgh') for _ in range(200000)))
+        self.files = [('image.fits', path)]
+
+    def archive(self, level, archive_format='zip'):
+        return b''.join(stream_archive(self.files, 'plan', archive_format, level).streaming_content)
+
+    def test_zip_level(self):
+        # Fails if the level set on the zip entries stops being used by zipfile
+        sizes = {level: len(self.archive(level)) for level in (0, 1, 9)}
+        self.assertGreater(sizes[0], sizes[1])
+        self.assertGreater(sizes[1], sizes[9])
+
+    def test_tar_gz_level_0(self):
+        data = self.archive(0, 'tar.gz')
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+            member = archive.extractfile('image.fits').read()
+        with open(self.files[0][1], 'rb') as f:
+            self.assertEqual(member, f.read())
+
+
+class PlanProgressImagesTests(SimpleTestCase):
+    """
+    Frames of the running document found in the images folder.
+    """
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        # A frame of an earlier night
+        self.write('Image00001.fit', mtime=time.time() - 86400)
+        self.instructions = format_instructions([('TakeImage', 1.0), ('TakeImage', 1.0), ('WaitFor', 2)])
+
+    def write(self, name, mtime=None):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(b'SIMPLE')
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    @override_settings(IMAGES_PREFIX='Image')
+    def test_only_new_frames_of_the_document(self):
+        progress = PlanProgress(self.instructions)
+        self.write('Image00002.fit')
+        self.write('Flat_R_001.fits')
+        self.write('notes.txt')
+        self.assertTrue(progress.follow_images(self.folder))
+        self.assertEqual(progress.n_images, 1)
+        self.assertEqual(progress.n_done, 1)
+
+    def test_prefix_learned_from_the_result_document(self):
+        progress = PlanProgress(self.instructions)
+        self.write('Image00002.fit')
+        self.write('Flat_R_001.fits')
+        self.assertTrue(progress.follow_images(self.folder))
+        self.assertEqual(progress.n_images, 2)
+
+        orc = os.path.join(self.folder, 'plan.ORC')
+        with open(orc, 'w') as f:
+            f.write('TakeImage      :  1.00 C:\\OV\\Images\\Image00002.fit No error.  '
+                    'Error code = 0 (0x0). 10/19/23 22:03:00\n')
+        progress.follow(orc)
+        self.assertEqual(progress.image_prefix, 'Image')
+        self.write('Image00003.fit')
+        self.write('Image00004.fit')
+        self.assertTrue(progress.follow_images(self.folder))
+        # Not the flat
+        self.assertEqual(progress.n_images, 3)
@@ -18,10 +18,14 @@ urlpatterns = [
     path('delete_plan/', delete_plan, name='delete_plan'),
     path('above_sky/', above_sky, name='above_sky'),
     path('fetch_plans/', fetch_plans, name='fetch_plans'),
+    path('fetch_plans_visibility/', views.fetch_plans_visibility, name='fetch_plans_visibility'),
     path('check_if_plan_ok/', check_if_plan_ok, name='check_if_plan_ok'),
     path('execute_plan/', views.execute_plan, name='execute_plan'),
     path('fetch_observed/', views.fetch_observed, name='fetch_observed'),
+    path('fetch_plan_results/', views.fetch_plan_results, name='fetch_plan_results'),
     path('request_file/', views.request_file, name='request_file'),
+    path('preview_file/', views.preview_file, name='preview_file'),
+    path('download_outputs/', views.download_outputs, name='download_outputs'),
     
     path('get_observable_presaved_list/', get_observable_presaved_list, name='get_observable_presaved_list')
 ]
\ No newline at end of file
@@ -9,24 +9,30 @@ from rest_framework.response import Response
 from django.http import HttpResponse
 from django.contrib.auth import get_user_model
 
-from base.executeobs import create_instructions_from_plan
-from .models import Reservation, Telescope
+from base.astropool import astronomy_pool
+from base.downloads import ARCHIVE_FORMATS, resolve_path, stream_archive, stream_file
+from base.executeobs import compile_plan, start_plan, validate_plan
+from base.listing import list_plans
+from base.previews import MAX_SIZE, STRETCHES, get_preview, preview_formats
+from base.catalogs import messier_catalog
+from base.planner import check_plan_now, get_plans_visibility, update_plan_windows
+from base.telescopestate import telescope_state
+from .models import Reservation
     
 from .decorators import require_keys
 from django.conf import settings
 
+import ntpath
 import os
-import pandas as pd
-
-from django.db import transaction
 
 ## auxiliares
-from .auxiliares import brasilia_to_utc, check_coordinate_for_obs_angle, check_plan_ok, get_abovesky_coordinates, convert_coord_to_degrees, get_alt_az, list_to_string, modificar_data_arquivo, utc_to_brasilia, get_body_coords
+from .auxiliares import brasilia_to_utc, get_abovesky_coordinates, convert_coord_to_degrees, get_alt_az, list_to_string, utc_to_brasilia
 
 ## models
-from .models import ObservationPlan
+from .models import InstructionResult, ObservationPlan
 
 import base.backgroundtask ## Just to start the background task is running
+import base.scheduler ## Starts the automatic queue scheduler
 
 @api_view(['GET'])
 #@permission_classes([IsAuthenticated])
@@ -75,12 +81,14 @@ def add_coordinate_to_plan(request):
     utc_start_date = brasilia_to_utc(start_date.strftime('%Y-%m-%d %H:%M:%S'))
     
     object_name = None
-    if 'object_name' in request.data:
-        object_name = request.data['object_name']
-        print(object_name)
-        ra, dec = get_body_coords(object_name, utc_start_date)
-    
-    status = check_coordinate_for_obs_angle(ra, dec, utc_start_date)
+    try:
+        if 'object_name' in request.data:
+            object_name = request.data['object_name']
+            print(object_name)
+            ra, dec = astronomy_pool.run('get_body_coords', object_name, utc_start_date)
+        status = astronomy_pool.run('check_coordinate_for_obs_angle', ra, dec, utc_start_date)
+    except TimeoutError:
+        return Response({"status": "error", "message": "Cálculo de visibilidade demorou demais, tente novamente."})
     
     allowed = status[0]
     distance = status[1]
@@ -106,7 +114,14 @@ def add_coordinate_to_plan(request):
         exptime = exptime,
         start_time = start_date,
     )
+    try:
+        validate_plan(obs_plan)
+    except ValueError as e:
+        return Response({"status": "error", "message": str(e)})
     obs_plan.save()
+    update_plan_windows([obs_plan])
+    # Compiled once here, execute_plan only writes the stored document
+    compile_plan(obs_plan)
     
     return Response({
             "status": "success",
@@ -117,18 +132,45 @@ def add_coordinate_to_plan(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def fetch_plans(request):
-
-    time = utc_to_brasilia(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
-    plans = ObservationPlan.objects.filter(user=request.user).order_by('start_time')
-
-    return Response(plans.values())
+    # Pagination, fields and filters are optional, see base.listing
+    return list_plans(request, ObservationPlan.objects.filter(user=request.user))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def fetch_observed(request):
-    plans = ObservationPlan.objects.filter(user=request.user, executed = True)
+    return list_plans(request, ObservationPlan.objects.filter(user=request.user, executed = True))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@require_keys('plan_id')
+def fetch_plan_results(request):
+    plans = ObservationPlan.objects.filter(id=request.query_params['plan_id'])
+    if not request.user.is_staff:
+        plans = plans.filter(user=request.user)
     
-    return Response(plans.values())
+    results = InstructionResult.objects.filter(plan__in=plans).order_by('step')
+    return Response(results.values('step', 'command', 'arguments', 'filename', 'message', 'error_code', 'finished_at', 'duration'))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def fetch_plans_visibility(request):
+    plans = ObservationPlan.objects.filter(user=request.user, executed=False)
+    visibility = get_plans_visibility(plans)
+    
+    response = []
+    for plan_id, entry in visibility.items():
+        if entry is None:
+            response.append({"plan_id": plan_id, "planned": False})
+            continue
+        response.append({
+            "plan_id": plan_id,
+            "planned": True,
+            "observable": entry['observable'],
+            "window_end": entry['window'][1] if entry['window'] else None,
+            "next_window_start": entry['next_window'][0] if entry['next_window'] else None,
+            "next_window_end": entry['next_window'][1] if entry['next_window'] else None,
+        })
+    return Response(response)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -155,7 +197,10 @@ def check_if_plan_ok(request):
     now = False
     if 'now' in request.data:
         now = True
-    allowed, distance, _, _ = check_plan_ok(plan, now)
+    try:
+        allowed, distance, _, _ = astronomy_pool.run('check_plan_ok', plan, now)
+    except TimeoutError:
+        return Response({"status": "error", "message": "Cálculo de visibilidade demorou demais, tente novamente."})
     
     if not allowed:
         return Response({
@@ -205,7 +250,7 @@ def get_reservations(request):
     hora = datetime.utcnow() + timedelta(hours=-int(settings.TEMPO_MAXIMO))
     brazilian_time = utc_to_brasilia(hora.strftime('%Y-%m-%d %H:%M:%S')).replace(tzinfo=None)
     
-    reservations = Reservation.objects.filter(start_time__gte=brazilian_time).order_by('start_time')
+    reservations = Reservation.objects.filter(start_time__gte=brazilian_time).select_related('user').order_by('start_time')
 
     reservs = []
     for reservation in reservations:
@@ -260,60 +305,138 @@ def execute_plan(request):
     now = utc_to_brasilia(datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')).replace(tzinfo=None)
     
     if not request.user.is_staff:
-        reservations = Reservation.objects.filter(user=request.user, start_time__lte=now, end_time__gte=now)
-        if len(reservations) == 0:
+        if not Reservation.objects.filter(user=request.user, start_time__lte=now, end_time__gte=now).exists():
             return Response({"status": "error", "message": "Usuário não tem reserva para este horário."})
         
-    with transaction.atomic():
-        try: telescope = Telescope.objects.filter(name=settings.DB_NAME).select_for_update(nowait=True)
-        except: return Response({"status": "error", "message": "Telescópio ocupado."})
-        
-        if telescope[0].status != 'idle':
-            return Response({"status": "error", "message": "Telescópio ocupado."})
-        
-        plan = ObservationPlan.objects.get(id=request.data['plan_id'])
-        
-        allowed, distance, alt, azi = check_plan_ok(plan, now)
-        if not allowed:
-            return Response({
-                    "status": "error",
-                    "message": f"Angulo de observação não permitido, distância do zênite: {distance}."
-                })
-        
-        instructions = create_instructions_from_plan(plan.id)
-        instruction_name = str(plan.id).zfill(8)
-        
-        instructions_path = os.path.join(settings.ORCHESTRATE_FOLDER, instruction_name + ".txt")
-        with open(instructions_path, 'w') as f:
-            f.write(instructions)
-        modificar_data_arquivo(instructions_path, datetime(2020, 1, 1, 12, 0))
-        
-        telescope.update(status='Sending Instructions', operation=instructions, alt=alt, az=azi, ra=plan.ra, dec=plan.dec, executing_plan_id=plan.id, executing_plan_name=plan.name)
+    # Read from memory, the telescope is only taken in start_plan
+    if telescope_state.get()['status'] != 'idle':
+        return Response({"status": "error", "message": "Telescópio ocupado."})
+    
+    plan = ObservationPlan.objects.get(id=request.data['plan_id'])
+    
+    # Precomputed windows answer without recomputing the ephemerides
+    status = check_plan_now(plan)
+    if status is None:
+        try:
+            status = astronomy_pool.run('check_plan_ok', plan, now)
+        except TimeoutError:
+            return Response({"status": "error", "message": "Cálculo de visibilidade demorou demais, tente novamente."})
+    allowed, distance, alt, azi = status
+    if not allowed:
+        return Response({
+                "status": "error",
+                "message": f"Angulo de observação não permitido, distância do zênite: {distance}."
+            })
+    
+    try:
+        started = start_plan(plan, alt, azi)
+    except ValueError as e:
+        return Response({"status": "error", "message": str(e)})
+    if started is None:
+        return Response({"status": "error", "message": "Telescópio ocupado."})
     
     return Response({"status": "success", "message": "Plano executado."})
 
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 @require_keys('filename')
 def request_file(request):
-    file_path = os.path.join(settings.IMAGES_FOLDER, request.data['filename'])
+    params = request.query_params if request.method == 'GET' else request.data
+    
+    # Only files inside the images folder can be downloaded
+    file_path = resolve_path(settings.IMAGES_FOLDER, params['filename'])
+    if file_path is None:
+        return Response({"status": "error", "message": "Arquivo nao encontrado."})
+    
+    gzip = str(params.get('gzip', '')).lower() in ('1', 'true')
+    return stream_file(request, file_path, gzip=gzip)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@require_keys('filename')
+def preview_file(request):
+    params = request.query_params if request.method == 'GET' else request.data
+    
+    file_path = resolve_path(settings.IMAGES_FOLDER, params['filename'])
+    if file_path is None:
+        return Response({"status": "error", "message": "Arquivo nao encontrado."})
+    
+    method = params.get('stretch', 'zscale')
+    image_format = params.get('image_format', 'png')
+    try:
+        size = min(int(params.get('size', 256)), MAX_SIZE)
+    except ValueError:
+        size = 0
+    if size <= 0 or method not in STRETCHES or image_format not in preview_formats():
+        return Response({"status": "error", "message": "Parametros invalidos."}, status=400)
     
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+    try:
+        preview_path = get_preview(file_path, size, method, image_format)
+    except (OSError, ValueError) as e:
+        return Response({"status": "error", "message": f"Nao foi possivel ler a imagem: {e}"})
+    
+    content_type = "image/jpeg" if image_format == 'jpg' else "image/png"
+    response = stream_file(request, preview_path, content_type=content_type, as_attachment=False)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def download_outputs(request):
+    """
+    Streams the images of one or more executed plans as a single archive.
+    
+    Parameters: ``plan_id`` or ``plan_ids`` (list or comma separated), ``archive``
+    ('zip', 'tar' or 'tar.gz', default zip) and ``level`` (compression, 0 to 9).
+    """
+    params = request.query_params if request.method == 'GET' else request.data
+    
+    plan_ids = params.get('plan_ids', params.get('plan_id'))
+    if plan_ids is None:
+        return Response({'error': 'Missing keys: plan_id'}, status=400)
+    if isinstance(plan_ids, (list, tuple)):
+        plan_ids = [str(plan_id) for plan_id in plan_ids]
+    else:
+        plan_ids = str(plan_ids).split(',')
+    
+    archive_format = params.get('archive', 'zip')
+    try:
+        plan_ids = [int(plan_id) for plan_id in plan_ids if plan_id.strip()]
+        level = int(params.get('level', 6))
+    except ValueError:
+        return Response({"status": "error", "message": "Parametros invalidos."}, status=400)
+    if archive_format not in ARCHIVE_FORMATS or not 0 <= level <= 9:
+        return Response({"status": "error", "message": "Parametros invalidos."}, status=400)
+    
+    plans = ObservationPlan.objects.filter(id__in=plan_ids, executed=True)
+    if not request.user.is_staff:
+        plans = plans.filter(user=request.user)
+    
+    files = []
+    missing = 0
+    for plan in plans.order_by('id'):
+        for filename in (plan.outputs or '').split(','):
+            if not filename.strip():
+                continue
+            # Outputs may keep the Windows path written by orchestrate
+            filename = ntpath.basename(filename.strip())
+            file_path = resolve_path(settings.IMAGES_FOLDER, filename)
+            if file_path is None:
+                missing += 1
+                continue
+            files.append((f"plan_{plan.id}/{filename}", file_path))
+    
+    if not files:
         return Response({"status": "error", "message": "Arquivo nao encontrado."})
     
-    file = open(file_path, 'rb')
-    response = HttpResponse(file.read(), content_type="application/octet-stream")
+    name = f"plan_{plan_ids[0]}" if len(plan_ids) == 1 else "plans"
+    response = stream_archive(files, name, archive_format, level)
+    response['X-Missing-Files'] = str(missing)
     return response
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def get_observable_presaved_list(request):
-    df = pd.read_csv("base/documents/final_messier.csv")
-
-    for index, row in df.iterrows():
-        allowed, distance, _, _ = check_coordinate_for_obs_angle(row['RA'], row['DEC'])
-        if not allowed:
-            df.drop(index, inplace=True)
-    
-    return Response(df.to_dict(orient='records'))
\ No newline at end of file
+    payload = messier_catalog.get_payload()
+    return HttpResponse(payload, content_type="application/json")
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Change notifications for the orchestrate folders.
+
+The telescope monitor (`base.backgroundtask.check_telescope`) blocks on an
+`OrchestrateWatcher` instead of sleeping a fixed amount of time. When the
+`watchdog` package is available the watcher is driven by the operating system
+file events (inotify on Linux, ReadDirectoryChangesW on Windows) for the
+orchestrate folder and its ``done/`` and ``done/Errors/`` subfolders. Without
+it, the watcher falls back to the old behaviour of waking up every
+``poll_interval`` seconds.
+"""
+
+import threading
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, polling is used instead
+    FileSystemEventHandler = object
+    Observer = None
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Forwards create/delete/move/modify events to the watcher."""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ('created', 'deleted', 'moved', 'modified', 'closed'):
+            self.watcher.notify()
+
+
+class OrchestrateWatcher:
+    """
+    Wait for changes in the orchestrate folder tree.
+
+    Parameters
+    ----------
+    folder : str
+        The orchestrate folder. Subfolders (``done/``, ``done/Errors/``) are watched too.
+    mode : str, optional
+        ``'auto'`` uses file events when possible and polling otherwise,
+        ``'events'`` requires file events and ``'polling'`` always polls.
+    poll_interval : float, optional
+        Seconds between wake-ups when polling.
+    """
+
+    def __init__(self, folder, mode='auto', poll_interval=1):
+        self.folder = folder
+        self.mode = mode
+        self.poll_interval = poll_interval
+
+        self._changed = threading.Event()
+        self._observer = None
+
+    @property
+    def event_driven(self):
+        """True if the watcher is driven by file system events."""
+        return self._observer is not None
+
+    def start(self):
+        """Start watching. Falls back to polling if file events are not available."""
+        if self.mode == 'polling':
+            return
+
+        if Observer is None:
+            if self.mode == 'events':
+                raise RuntimeError("The 'watchdog' package is required for the events orchestrate watcher.")
+            print('watchdog not installed, polling the orchestrate folder')
+            return
+
+        try:
+            observer = Observer()
+            observer.schedule(_ChangeHandler(self), self.folder, recursive=True)
+            observer.daemon = True
+            observer.start()
+        except Exception as e:
+            if self.mode == 'events':
+                raise
+            print(f'Could not watch {self.folder} ({e}), polling the orchestrate folder')
+            return
+
+        self._observer = observer
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        self.notify()
+
+    def notify(self):
+        """Wake up whoever is waiting. Can also be called by in-process writers."""
+        self._changed.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until something changes or ``timeout`` seconds pass.
+
+        Args:
+            timeout (float, optional): Maximum time to wait, in seconds.
+
+        Returns:
+            bool: True if woken up by a change (always True when polling).
+        """
+        if not self.event_driven:
+            if timeout is None or timeout > self.poll_interval:
+                timeout = self.poll_interval
+            self._changed.wait(timeout)
+            self._changed.clear()
+            return True
+
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
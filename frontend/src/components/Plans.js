@@ -21,10 +21,10 @@ export default function Plans({ onPlansUpdate }) {
 
 
     const fetch_plans = () => {
-        axios.get("/api/fetch_plans/")
+        // Executed plans belong in Results, not Plans
+        axios.get("/api/fetch_plans/", { params: { executed: 'false', fields: 'id,name,object_name,ra,dec,filters,framemode,exptime,start_time,executed' } })
             .then((response) => {
-                // Filter out executed plans - they belong in Results, not Plans
-                const nonExecutedPlans = response.data.filter(plan => !plan.executed);
+                const nonExecutedPlans = response.data;
                 setPlans(nonExecutedPlans);
                 console.log('Filtered plans (non-executed only):', nonExecutedPlans);
                 
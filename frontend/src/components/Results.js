@@ -5,16 +5,27 @@ import { toast } from 'react-toastify';
 
 import { getCookie } from '../auth/cookies';
 
+const PAGE_SIZE = 20;
+
 export default function Results(props) {
     const [results, setResults] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const navigate = useNavigate();
 
-    useEffect(() => {
-        axios.get('/api/fetch_observed')
+    // Most recent first, one page at a time
+    const loadPage = (cursor) => {
+        const params = { order: 'desc', limit: PAGE_SIZE };
+        if (cursor) params.cursor = cursor;
+        axios.get('/api/fetch_observed/', { params })
             .then((res) => {
-                setResults(res.data.reverse());
+                setResults((previous) => cursor ? [...previous, ...res.data] : res.data);
+                setNextCursor(res.headers['x-next-cursor'] || null);
             })
             .catch((err) => console.log(err));
+    };
+
+    useEffect(() => {
+        loadPage(null);
     }, []);
 
     return (
@@ -44,6 +55,17 @@ export default function Results(props) {
                     <Result key={result.id} result={result} />
                 ))
             )}
+
+            {nextCursor && (
+                <div className="text-center my-6">
+                    <button
+                        onClick={() => loadPage(nextCursor)}
+                        className="bg-blue-500 text-white px-4 py-2 rounded-md hover:bg-blue-600 transition"
+                    >
+                        Carregar mais
+                    </button>
+                </div>
+            )}
         </div>
     )
 }
@@ -74,10 +96,14 @@ const Result = ({ result }) => {
                             responseType: 'blob'
                         });
                         
+                        // Missing files are answered with a JSON error
+                        if (response.data.type === 'application/json') throw new Error(`${gifFilename} not found`);
+                        
                         let url = URL.createObjectURL(response.data);
                         newImages[filters[i]] = url;
                     } catch (error) {
-                        console.error(`Error fetching ${filters[i]} image:`, error);
+                        // No GIF from CCDSoft, use a preview rendered from the FITS frame
+                        newImages[filters[i]] = `/api/preview_file/?filename=${encodeURIComponent(filenames[i])}`;
                     }
                 }
 
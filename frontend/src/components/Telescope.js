@@ -5,10 +5,11 @@ import sio from "../auth/socket";
 export default function TelescopeStatus({ onPositionUpdate }) {
 
     const [telescopeStatus, setTelescopeStatus] = useState({});
+    const [progress, setProgress] = useState(null);
 
     useEffect(() => {
 
-        sio.on("telescope_status", (message) => {
+        const updateStatus = (message) => {
             setTelescopeStatus(message);
             
             // Notify parent component about position update
@@ -21,14 +22,31 @@ export default function TelescopeStatus({ onPositionUpdate }) {
                     status: message.status
                 });
             }
+        };
+
+        // Full state on connect, then only the fields that changed
+        let current = {};
+        sio.on("telescope_status", (message) => {
+            current = message;
+            updateStatus(current);
+        });
+        sio.on("telescope_status_diff", (diff) => {
+            current = { ...current, ...diff };
+            updateStatus(current);
+        });
+
+        // Progress of the running plan, the ETA counts down from the moment it was received
+        sio.on("plan_progress", (message) => {
+            setProgress(message ? { ...message, receivedAt: Date.now() } : null);
         });
 
         sio.send('check_telescope_status');
-        const interval = setInterval(() => {
-            sio.send('check_telescope_status');
-        }, 5000);
 
-        return () => clearInterval(interval);
+        return () => {
+            sio.off("telescope_status");
+            sio.off("telescope_status_diff");
+            sio.off("plan_progress");
+        };
         
     }, [onPositionUpdate]);
 
@@ -36,10 +54,41 @@ export default function TelescopeStatus({ onPositionUpdate }) {
     return (
         <div className="w-full max-w-xl mx-auto py-6 px-4 rounded-md">
             <TelescopeStatusDiv data={telescopeStatus} />
+            {progress && <PlanProgress progress={progress} />}
         </div>
     );
 }
 
+const formatSeconds = (seconds) => {
+    const minutes = Math.floor(seconds / 60);
+    return `${minutes}:${String(Math.floor(seconds % 60)).padStart(2, '0')}`;
+};
+
+const PlanProgress = ({ progress }) => {
+    const [now, setNow] = useState(Date.now());
+
+    useEffect(() => {
+        const timer = setInterval(() => setNow(Date.now()), 1000);
+        return () => clearInterval(timer);
+    }, []);
+
+    const passed = (now - progress.receivedAt) / 1000;
+    const eta = Math.max(progress.eta - passed, 0);
+    const percent = progress.expected > 0 ? Math.min(100, 100 * (1 - eta / progress.expected)) : 0;
+
+    return (
+        <div className="w-full bg-gray-800 text-white p-4 mt-4 rounded-lg shadow-md">
+            <p className="mb-2">
+                <span className="font-semibold">Passo {progress.step + 1} de {progress.n_steps}:</span> {progress.command} {progress.argument}
+            </p>
+            <div className="w-full bg-gray-600 rounded h-3 mb-2">
+                <div className="bg-green-400 h-3 rounded" style={{ width: `${percent}%` }} />
+            </div>
+            <p className="text-sm">Tempo restante estimado: {formatSeconds(eta)} (decorrido: {formatSeconds(progress.elapsed + passed)})</p>
+        </div>
+    );
+};
+
 const getStatusColor = (status) => {
     if (!status) return 'bg-gray-300';
     if (status === 'idle') return 'bg-yellow-200';
@@ -0,0 +1,54 @@
+"""
+Benchmark of convert_coord_to_degrees (fast parser) against the SkyCoord
+based conversion it replaced.
+
+Run it from the argus_server folder, so config.ini is found:
+
+    cd argus_server
+    python ../scripts/bench_coord_parser.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'argus_server.settings')
+
+import django
+django.setup()
+
+from base.auxiliares import _parse_angle, _skycoord_to_degrees, convert_coord_to_degrees
+
+COORDINATES = [
+    (83.63308333, 22.0145),
+    ("161.275125", "-59.86661111111111"),
+    ("12h30m0s", "+30d45m45s"),
+    ("21h 33.5m", "0° 49'"),
+    ("12.5h", "30.5"),
+    ("12:30:00", "+30:45:45"),
+]
+REPEAT = 200
+
+
+def bench(function, clear_memo=False):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        if clear_memo:
+            _parse_angle.cache_clear()
+        for ra, dec in COORDINATES:
+            function(ra, dec)
+    return (time.perf_counter() - start) / (REPEAT * len(COORDINATES))
+
+
+if __name__ == '__main__':
+    # Warm up astropy
+    bench(_skycoord_to_degrees)
+
+    skycoord = bench(_skycoord_to_degrees)
+    parser = bench(convert_coord_to_degrees, clear_memo=True)
+    memo = bench(convert_coord_to_degrees)
+
+    print(f"SkyCoord:             {skycoord * 1e6:10.2f} us per coordinate")
+    print(f"Fast parser:          {parser * 1e6:10.2f} us per coordinate ({skycoord / parser:.0f}x)")
+    print(f"Fast parser (memo):   {memo * 1e6:10.2f} us per coordinate ({skycoord / memo:.0f}x)")
@@ -0,0 +1,121 @@
+"""
+Load benchmark of a running argus server: concurrent REST and Socket.IO traffic.
+
+REST workers request the endpoints of ``--endpoints`` in a loop, while socket
+clients ask ``check_telescope_status`` and wait for the ``telescope_status``
+answer. The p50/p99 latencies of each kind of traffic are printed, so the
+eventlet (``python manage.py runserver``) and the ASGI
+(``uvicorn argus_server.asgi:application --port 8000``) servers can be compared
+under the same load:
+
+    python scripts/bench_server_load.py --email user@example.com --password ...
+
+Needs ``requests`` and ``python-socketio[client]``; without ``websocket-client``
+the socket clients use long polling.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+import requests
+import socketio
+
+ENDPOINTS = ['/api/fetch_plans/', '/api/get_observable_presaved_list/', '/api/above_sky/']
+
+
+def login(url, email, password):
+    """Session cookies of an authenticated user."""
+    session = requests.Session()
+    response = session.post(f'{url}/api/auth/login/', json={'email': email, 'password': password})
+    response.raise_for_status()
+    return session.cookies.get_dict()
+
+
+def rest_worker(url, cookies, endpoints, stop, latencies, errors):
+    session = requests.Session()
+    session.cookies.update(cookies)
+    i = 0
+    while not stop.is_set():
+        endpoint = endpoints[i % len(endpoints)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = session.get(url + endpoint, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException:
+            errors.append(endpoint)
+            continue
+        latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+
+
+def socket_worker(url, cookies, stop, latencies, errors, interval):
+    client = socketio.Client(reconnection=False)
+    answered = threading.Event()
+    client.on('telescope_status', lambda data: answered.set())
+    cookie = '; '.join(f'{name}={value}' for name, value in cookies.items())
+    try:
+        client.connect(url, headers={'Cookie': cookie}, wait_timeout=10)
+    except socketio.exceptions.ConnectionError:
+        errors.append('connect')
+        return
+    # The connection itself sends a first status
+    answered.wait(10)
+
+    while not stop.is_set():
+        answered.clear()
+        start = time.perf_counter()
+        client.emit('check_telescope_status', {})
+        if answered.wait(30):
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append('telescope_status')
+        time.sleep(interval)
+    client.disconnect()
+
+
+def report(name, values):
+    if not values:
+        print(f'{name:45s} no answers')
+        return
+    values = np.array(values) * 1e3
+    print(f'{name:45s} n={len(values):6d}  p50={np.percentile(values, 50):8.1f} ms  '
+          f'p99={np.percentile(values, 99):8.1f} ms  max={values.max():8.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--rest-workers', type=int, default=8, help='concurrent REST workers')
+    parser.add_argument('--socket-clients', type=int, default=20, help='connected socket clients')
+    parser.add_argument('--socket-interval', type=float, default=0.1, help='seconds between the requests of a socket client')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS, help='REST endpoints requested in turn')
+    args = parser.parse_args()
+
+    cookies = login(args.url, args.email, args.password)
+    stop = threading.Event()
+    rest_latencies, socket_latencies, errors = {}, [], []
+    threads = [
+        threading.Thread(target=rest_worker, args=(args.url, cookies, args.endpoints, stop, rest_latencies, errors))
+        for _ in range(args.rest_workers)
+    ] + [
+        threading.Thread(target=socket_worker, args=(args.url, cookies, stop, socket_latencies, errors, args.socket_interval))
+        for _ in range(args.socket_clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f'{args.rest_workers} REST workers, {args.socket_clients} socket clients, {args.duration:.0f} s')
+    for endpoint, values in sorted(rest_latencies.items()):
+        report(f'GET {endpoint}', values)
+    report('socket check_telescope_status', socket_latencies)
+    if errors:
+        print(f'{len(errors)} errors')